@@ -1,104 +1,96 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import re
 import os
 
 import click
-import pandas as pd
-from google.cloud.storage.client import Client
 
 import mobius
 
 BUCKET = "mobility-reports"
 
-def get(filetype="SVG", regex="\d{4}-\d{2}-\d{2}_.+"):
-    client = Client.create_anonymous_client()
-    blobs = filter(
-        lambda b: re.match(f"{filetype}/{regex}", b.name),
-        client.list_blobs(BUCKET),
+# Keys of mobius.extraction.TEXT_BACKENDS, listed here so that building the
+# CLI does not import NumPy
+TEXT_BACKENDS = ["layout", "roi", "chars"]
+
+# Options shared by several commands
+text_backend_option = click.option(
+    "--text-backend",
+    type=click.Choice(TEXT_BACKENDS),
+    default="layout",
+    show_default=True,
+    help="How PDF text is extracted: full layout, only the queried regions "
+    "(roi) or glyphs merged into lines (chars)",
+)
+
+dataset_option = click.option(
+    "--dataset",
+    type=click.Path(file_okay=False),
+    help="Also write the full results to the Parquet dataset in this folder, "
+    "partitioned by release date and country (requires pyarrow)",
+)
+
+
+def no_cache_option(caches="the caches of PDF text and SVG subplots"):
+    return click.option(
+        "--no-cache", is_flag=True, help=f"Neither read nor write {caches}",
     )
-    return list(blobs)
 
 
-def get_country(blob):
-    name = blob.name.split("/")[-1]
-    country = name.replace("Mobility_Report_en", "")[11:-5]
-    return country
+def bucket_index():
+    """Cached listing of the bucket, or of the folder given by --bucket-dir"""
+    ctx = click.get_current_context(silent=True)
+    options = (ctx.find_root().obj if ctx else None) or {}
+
+    if options.get("bucket_dir"):
+        source = mobius.bucket.LocalSource(options["bucket_dir"])
+    else:
+        source = mobius.bucket.GCSSource(BUCKET)
+
+    ttl = 0 if options.get("refresh") else mobius.bucket.DEFAULT_TTL
+    return mobius.bucket.BucketIndex(source, ttl=ttl)
+
+
+def text_cache():
+    return mobius.cache.ArrayCache(mobius.cache.default_cache_dir("text"))
+
+
+def subplot_cache():
+    return mobius.cache.ArrayCache(mobius.cache.default_cache_dir("svg"))
 
 
 def show_dates():
-    dates = []
-    blobs = list(get(filetype='PDF'))
-    for i, blob in enumerate(blobs):
-        date = blob.name.split("/")[-1].split('_')[0]
-        if blob.name.split("/")[-1].split('_')[0] not in dates:
-            dates.append(blob.name.split("/")[-1].split('_')[0])
-            print(f"{date}")
+    for date in bucket_index().dates("PDF"):
+        print(date)
 
 
-def show(filetype, date):
+def show(filetype, date, output_format="table"):
     url_prefix = "https://storage.cloud.google.com/mobility-reports/"
-    country_names = pd.read_csv(os.path.join(os.getcwd(),'config/country_codes.csv'))
-    MAXLEN = 25
-    MAXLEN_COUNTRY = 40
-    blobs = list(get(filetype=filetype))
-    print("Available countries:")
-    if date != None:
-        for i, blob in enumerate(blobs):
-            if blob.name.split("/")[-1].split('_')[0] == date:
-                country = get_country(blob)
-                country_name = country_names.loc[country_names['code'] == f"-{country[0:2]}", 'name'].item()
-                country = (
-                    country + (" " * (MAXLEN - len(country)))
-                    if len(country) < MAXLEN
-                    else country[:MAXLEN]
-                )
-                country_name = (
-                    country_name + (" " * (MAXLEN_COUNTRY - len(country_name)))
-                    if len(country_name) < MAXLEN_COUNTRY
-                    else country_name[:MAXLEN_COUNTRY]
-                )
-
-
-                iteration = str(i + 1)
-                iteration = (
-                    iteration
-                    if (len(iteration) == 3)
-                    else (" " * (3 - len(iteration)) + iteration)
-                )
-                print(f" {iteration}. {country} {country_name}  {date}  ({url_prefix + blob.name})")
+    country_names = mobius.bucket.load_country_names(
+        os.path.join(os.getcwd(), "config/country_codes.csv")
+    )
 
-    else:
-        print('x')
-        for i, blob in enumerate(blobs):
-            pdf_date = blob.name.split("/")[-1].split('_')[0]
-            country = get_country(blob)
-            country_name = country_names.loc[country_names['code'] == f"-{country[0:2]}", 'name'].item()
-            country = (
-                country + (" " * (MAXLEN - len(country)))
-                if len(country) < MAXLEN
-                else country[:MAXLEN]
-            )
-            country_name = (
-                country_name + (" " * (MAXLEN_COUNTRY - len(country_name)))
-                if len(country_name) < MAXLEN_COUNTRY
-                else country_name[:MAXLEN_COUNTRY]
-            )
-
-
-            iteration = str(i + 1)
-            iteration = (
-                iteration
-                if (len(iteration) == 3)
-                else (" " * (3 - len(iteration)) + iteration)
-            )
-            print(f" {iteration}. {country} {country_name}  {pdf_date}   ({url_prefix + blob.name})")
+    blobs = bucket_index().lookup(filetype, date=date)
+    rows = mobius.bucket.listing_rows(blobs, country_names, url_prefix)
 
+    if output_format == "table":
+        print("Available countries:")
+    print(mobius.bucket.format_listing(rows, output_format))
 
 
 @click.group(help="Downloader and processor for Google mobility reports")
-def cli():
-    pass
+@click.option(
+    "--refresh",
+    is_flag=True,
+    help="List the bucket again rather than use the cached listing",
+)
+@click.option(
+    "--bucket-dir",
+    type=click.Path(exists=True, file_okay=False),
+    help="Local folder laid out like the bucket, used in its place",
+)
+@click.pass_context
+def cli(ctx, refresh, bucket_dir):
+    ctx.obj = {"refresh": refresh, "bucket_dir": bucket_dir}
 
 
 @cli.command(help="List all the dates reports are available for")
@@ -108,68 +100,108 @@ def dt():
 
 @cli.command(help="List all the SVGs available in the buckets")
 @click.argument("DATE", required = False)
-def svg(date):
-    show("SVG", date)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(mobius.bucket.LISTING_FORMATS),
+    default="table",
+    show_default=True,
+    help="Print an aligned table, JSON or CSV",
+)
+def svg(date, output_format):
+    show("SVG", date, output_format)
 
 
 @cli.command(help="List all the PDFs available in the buckets")
 @click.argument("DATE", required = False)
-def pdf(date):
-    show("PDF", date)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(mobius.bucket.LISTING_FORMATS),
+    default="table",
+    show_default=True,
+    help="Print an aligned table, JSON or CSV",
+)
+def pdf(date, output_format):
+    show("PDF", date, output_format)
 
 
 @cli.command(help="Download pdf and svg for a given country using the country code")
 @click.argument("COUNTRY_CODE")
 @click.argument("DATE", required = False)
-def download(country_code, date):
-    client = Client.create_anonymous_client()
-
-    def _download(blobs, extension, date):
-
-        download_count = 0
-
-        if len(blobs) and date != None:
-            for blob in blobs:
-                if blob.name.split("/")[-1].split('_')[0] == date:
-                    fname = f"{extension}s/{get_country(blob)}_{date}.{extension}"
-                    with open(fname, "wb+") as fileobj:
+@click.option(
+    "-j",
+    "--workers",
+    default=mobius.bucket.DEFAULT_FETCH_WORKERS,
+    show_default=True,
+    help="Number of files downloaded at once",
+)
+def download(country_code, date, workers):
+    index = bucket_index()
 
-                        client.download_blob_to_file(blob, fileobj)
+    failures = 0
+    for extension in ("svg", "pdf"):
+        blobs = index.lookup(extension.upper(), date=date, country=country_code)
 
-                    print(
-                        f"Download {country_code} {date} {extension} complete. Saved to /{extension}s"
-                    )
-                    download_count += 1
+        if not blobs:
+            print(f"Could not find a {extension} file for code {country_code}")
 
-        if len(blobs) and date == None:
-            for blob in blobs:
-                pdf_date = blob.name.split("/")[-1].split('_')[0]
-                fname = f"{extension}s/{get_country(blob)}_{pdf_date}.{extension}"
-                with open(fname, "wb+") as fileobj:
+        failures += _fetch(index, blobs, workers)
 
-                    client.download_blob_to_file(blob, fileobj)
+    if failures:
+        raise SystemExit(1)
 
-                print(
-                    f"Download {country_code}_{pdf_date} {extension} complete. Saved to /{extension}s"
-                )
-                download_count += 1
 
+@cli.command(
+    "download-all", help="Download the pdf and svg of every country for a given date"
+)
+@click.argument("DATE")
+@click.option(
+    "-c",
+    "--country",
+    "countries",
+    multiple=True,
+    help="Country code to download, may be repeated (defaults to all)",
+)
+@click.option(
+    "-j",
+    "--workers",
+    default=mobius.bucket.DEFAULT_FETCH_WORKERS,
+    show_default=True,
+    help="Number of files downloaded at once",
+)
+def download_all(date, countries, workers):
+    index = bucket_index()
 
+    blobs = index.lookup("SVG", date=date) + index.lookup("PDF", date=date)
+    if countries:
+        blobs = [blob for blob in blobs if blob.country in countries]
 
-        if download_count == 0:
-            print(f"Could not find a {extension} file for code {country_code}")
+    if not blobs:
+        print(f"Could not find any files for {date}")
 
-        
+    failures = _fetch(index, blobs, workers)
 
+    if failures:
+        raise SystemExit(1)
 
 
-    regex = f"\d{{4}}-\d{{2}}-\d{{2}}_{country_code}_M.+"
+def _fetch(index, blobs, workers):
+    """Download with `mobius.bucket.fetch`, printing the outcome of each blob"""
+    failures = 0
+    for blob, status in mobius.bucket.fetch(index.source, blobs, workers=workers):
+        extension = blob.filetype.lower()
+        label = f"{blob.country} {blob.date} {extension}"
 
-    blobs = get(filetype="SVG", regex=regex)
-    _download(blobs, "svg", date)
+        if status == "downloaded":
+            print(f"Download {label} complete. Saved to /{extension}s")
+        elif status == "skipped":
+            print(f"{label} is up to date in /{extension}s")
+        else:
+            print(f"Download {label} {status}")
+            failures += 1
 
-    blobs = get(filetype="PDF", regex=regex)
-    _download(blobs, "pdf", date)
+    return failures
 
 
 @cli.command(help="Process a given country SVG")
@@ -188,25 +220,98 @@ def download(country_code, date):
     is_flag=True,
     help="Enables creation and saving of additional PNG plots",
 )
-def proc(input_location, output_folder, folder, dates_file, svgs, plots):
+@click.option(
+    "--plot-workers",
+    type=int,
+    help="Number of processes rendering PNG plots (defaults to CPU count)",
+)
+@click.option(
+    "--contact-sheet",
+    is_flag=True,
+    help="Also draw all plots into a single PNG (plot/contact_sheet.png)",
+)
+@click.option(
+    "-w",
+    "--writers",
+    default=1,
+    show_default=True,
+    help="Number of threads writing extracted svgs",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Convert subplots while the SVG is parsed (numbered in document order)",
+)
+@no_cache_option("the cache of split SVG subplots")
+def proc(
+    input_location,
+    output_folder,
+    folder,
+    dates_file,
+    svgs,
+    plots,
+    plot_workers,
+    contact_sheet,
+    writers,
+    stream,
+    no_cache,
+):
 
     date_lookup_df = mobius.io.read_dates_lookup(dates_file)
 
     print(f"Processing {input_location}")
     output_folder = mobius.io.prep_output_folder(input_location, output_folder, folder)
-    data = mobius.graphs.graph_process(input_location, output_folder, svgs)
 
-    mobius.csv.process_all(data, date_lookup_df, output_folder, plots, save=True)
+    if stream:
+        data = mobius.graphs.iter_subplots(
+            input_location, output_folder if svgs else None
+        )
+    else:
+        data = mobius.graphs.graph_process(
+            input_location,
+            output_folder,
+            svgs,
+            writers,
+            cache=None if no_cache else subplot_cache(),
+        )
+
+    svg_df = mobius.csv.process_all(
+        data, date_lookup_df, output_folder, plots=False, save=True
+    )
+
+    if plots:
+        mobius.plots.render_plots(svg_df, output_folder, workers=plot_workers)
+
+    if contact_sheet:
+        os.makedirs(os.path.join(output_folder, "plot"), exist_ok=True)
+        mobius.plots.render_contact_sheet(
+            svg_df, os.path.join(output_folder, "plot", "contact_sheet.png")
+        )
 
 
 @cli.command(help="Produce summary CSV of regional headline figures from CSV")
 @click.argument("INPUT_PDF", type=click.Path(exists=True))
 @click.argument("OUTPUT_FOLDER")
 @click.argument("DATES_FILE")
-def summary(input_pdf, output_folder, dates_file):
+@click.option(
+    "-j",
+    "--workers",
+    default=1,
+    show_default=True,
+    help="Number of processes extracting text from PDF pages",
+)
+@text_backend_option
+@no_cache_option("the cache of extracted PDF text")
+def summary(input_pdf, output_folder, dates_file, workers, text_backend, no_cache):
 
     with mobius.io.open_document(input_pdf) as doc:
-        summary_df = mobius.extraction.summarise(doc, dates_file)
+        summary_df = mobius.extraction.summarise(
+            doc,
+            dates_file,
+            workers=workers,
+            text_backend=text_backend,
+            cache=None if no_cache else text_cache(),
+        )
 
     mobius.io.write_summary(summary_df, input_pdf, output_folder)
 
@@ -216,24 +321,256 @@ def summary(input_pdf, output_folder, dates_file):
 @click.argument("INPUT_SVG", type=click.Path(exists=True))
 @click.argument("OUTPUT_FOLDER")
 @click.argument("DATES_FILE")
-def full(input_pdf, input_svg, output_folder, dates_file):
+@click.option(
+    "-j",
+    "--workers",
+    default=1,
+    show_default=True,
+    help="Number of processes extracting text from PDF pages",
+)
+@text_backend_option
+@no_cache_option()
+@click.option(
+    "--with-summary",
+    is_flag=True,
+    help="Also write the summary CSV, as the summary command, from the same "
+    "extracted PDF text",
+)
+@dataset_option
+def full(
+    input_pdf,
+    input_svg,
+    output_folder,
+    dates_file,
+    workers,
+    text_backend,
+    no_cache,
+    with_summary,
+    dataset,
+):
+
+    mobius.batch.process_report(
+        input_pdf,
+        input_svg,
+        output_folder,
+        dates_file,
+        workers=workers,
+        text_backend=text_backend,
+        text_cache=None if no_cache else text_cache(),
+        subplot_cache=None if no_cache else subplot_cache(),
+        with_summary=with_summary,
+        dataset=dataset,
+    )
 
-    with mobius.io.open_document(input_pdf) as doc:
-        summary_df = mobius.extraction.summarise(doc, dates_file)
 
-    data = mobius.graphs.graph_process(input_svg, None, False)
+@cli.command(help="Produce full and summary CSVs for a folder of PDF/SVG reports")
+@click.argument("INPUT_LOCATION")
+@click.argument("OUTPUT_FOLDER")
+@click.argument("DATES_FILE", type=click.Path(exists=True))
+@click.option(
+    "--svg-folder",
+    type=click.Path(exists=True, file_okay=False),
+    help="Folder of the SVGs named as the PDFs, defaults to alongside each PDF",
+)
+@click.option(
+    "-j",
+    "--workers",
+    type=int,
+    help="Number of reports processed at once (defaults to CPU count)",
+)
+@text_backend_option
+@no_cache_option()
+@click.option(
+    "-v", "--verbose", is_flag=True, help="Print the validation of every report",
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    help="Rebuild every report, even if unchanged since the last run",
+)
+@click.option(
+    "-n",
+    "--dry-run",
+    is_flag=True,
+    help="Only list the reports that would be rebuilt, and why",
+)
+@dataset_option
+def batch(
+    input_location,
+    output_folder,
+    dates_file,
+    svg_folder,
+    workers,
+    text_backend,
+    no_cache,
+    verbose,
+    force,
+    dry_run,
+    dataset,
+):
+    """INPUT_LOCATION is a folder of PDFs or a glob pattern matching them.
+
+    Reports whose PDF, SVG, dates lookup, options and code version are the
+    same as recorded in OUTPUT_FOLDER/manifest.json, and whose outputs still
+    exist, are skipped.
+    """
+    reports = mobius.batch.find_reports(input_location, svg_folder)
+
+    if not reports:
+        raise click.ClickException(f"No PDFs found in {input_location}")
+
+    manifest = mobius.manifest.Manifest.load(
+        os.path.join(output_folder, mobius.manifest.MANIFEST_FILENAME)
+    )
+    planned = manifest.plan(
+        reports,
+        dates_file,
+        {"text_backend": text_backend, "dataset": dataset},
+        force=force,
+    )
 
-    date_lookup_df = mobius.io.read_dates_lookup(dates_file)
+    print(f"{len(planned)} of {len(reports)} reports to rebuild")
+    for report, _, reason in planned:
+        print(f"  {report.name}: {reason}")
+
+    if dry_run or not planned:
+        return
+
+    os.makedirs(output_folder, exist_ok=True)
+
+    results = mobius.batch.run_batch(
+        [report for report, _, _ in planned],
+        output_folder,
+        dates_file,
+        workers=workers,
+        text_backend=text_backend,
+        text_cache=None if no_cache else text_cache(),
+        subplot_cache=None if no_cache else subplot_cache(),
+        with_summary=True,
+        dataset=dataset,
+    )
+
+    for (report, entry, _), result in zip(planned, results):
+        if result.ok:
+            manifest.record(report.name, entry, result.outputs)
+    manifest.save()
 
-    svg_df = mobius.csv.process_all(data, date_lookup_df)
+    _print_results(results, verbose)
 
-    result_df = pd.merge(
-        summary_df, svg_df, left_on="plot_num", right_on="graph_num", how="outer"
+
+@cli.command(help="Download and process every report for a date, overlapping both")
+@click.argument("DATE")
+@click.argument("OUTPUT_FOLDER")
+@click.argument("DATES_FILE", type=click.Path(exists=True))
+@click.option(
+    "-c",
+    "--country",
+    "countries",
+    multiple=True,
+    help="Country code to process, may be repeated (defaults to all)",
+)
+@click.option(
+    "-j",
+    "--workers",
+    type=int,
+    help="Number of reports processed at once (defaults to CPU count)",
+)
+@click.option(
+    "--download-workers",
+    default=mobius.bucket.DEFAULT_FETCH_WORKERS,
+    show_default=True,
+    help="Number of reports downloaded at once",
+)
+@click.option(
+    "--queue-size",
+    default=4,
+    show_default=True,
+    help="Number of reports that may wait between download, processing and "
+    "writing",
+)
+@text_backend_option
+@no_cache_option()
+@click.option(
+    "-v", "--verbose", is_flag=True, help="Print the validation of every report",
+)
+@dataset_option
+def pipeline(
+    date,
+    output_folder,
+    dates_file,
+    countries,
+    workers,
+    download_workers,
+    queue_size,
+    text_backend,
+    no_cache,
+    verbose,
+    dataset,
+):
+    """Reports are downloaded to ./pdfs and ./svgs, as by download-all, and
+    processed as soon as both files of a report have arrived."""
+    index = bucket_index()
+
+    blobs = index.lookup("PDF", date=date) + index.lookup("SVG", date=date)
+    if countries:
+        blobs = [blob for blob in blobs if blob.country in countries]
+
+    if not blobs:
+        raise click.ClickException(f"No reports found for {date}")
+
+    results = mobius.pipeline.run_pipeline(
+        index.source,
+        blobs,
+        output_folder,
+        dates_file,
+        workers=workers,
+        download_workers=download_workers,
+        queue_size=queue_size,
+        text_backend=text_backend,
+        text_cache=None if no_cache else text_cache(),
+        subplot_cache=None if no_cache else subplot_cache(),
+        dataset=dataset,
+    )
+
+    _print_results(results, verbose)
+
+
+def _print_results(results, verbose=False):
+    """Print failed (or with `verbose` all) reports and a count, exiting with
+    status 1 if any failed"""
+    failures = [result for result in results if not result.ok]
+
+    for result in results:
+        if verbose or not result.ok:
+            print(f"\n== {result.name} ==")
+            print(result.output, end="")
+        if not result.ok:
+            print(result.error)
+
+    print(
+        f"Processed {len(results)} reports: {len(results) - len(failures)} "
+        f"succeeded, {len(failures)} failed"
     )
+    for result in failures:
+        print(f"  FAILED {result.name}: {result.error.strip().splitlines()[-1]}")
+
+    if failures:
+        raise SystemExit(1)
+
+
+@cli.group(help="Manage the caches of extracted PDF text and SVG subplots")
+def cache():
+    pass
+
 
-    mobius.extraction.validate(result_df)
+@cache.command(help="Remove every cached entry")
+def clear():
+    removed = text_cache().clear()
+    print(f"Removed {removed} cached text entries")
 
-    mobius.io.write_full_results(result_df, input_pdf, output_folder)
+    removed = subplot_cache().clear()
+    print(f"Removed {removed} cached subplot entries")
 
 
 if __name__ == "__main__":
@@ -1,4 +1,30 @@
-import mobius.csv
-import mobius.extraction
-import mobius.graphs
-import mobius.io
+"""Submodules are imported on first attribute access (`mobius.csv` etc.), so
+importing the package does not load pandas, NumPy or matplotlib."""
+import importlib
+
+_SUBMODULES = (
+    "batch",
+    "bucket",
+    "cache",
+    "csv",
+    "dataset",
+    "extraction",
+    "graphs",
+    "io",
+    "manifest",
+    "paths",
+    "pipeline",
+    "plots",
+    "spatial",
+)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULES))
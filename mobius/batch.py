@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""Process many PDF/SVG report pairs in a pool of worker processes.
+
+Each report runs in isolation: an exception is caught in the worker and
+recorded in its `ReportResult`, so one bad report does not stop the batch.
+
+Usage:
+    Main entry point is `run_batch`, with the report pairs from
+    `find_reports`.
+"""
+import collections
+import contextlib
+import glob
+import io
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from tqdm import tqdm
+
+import mobius.csv
+import mobius.dataset
+import mobius.extraction
+import mobius.graphs
+import mobius.io
+
+Report = collections.namedtuple("Report", ["name", "pdf", "svg"])
+
+ReportResult = collections.namedtuple(
+    "ReportResult", ["name", "ok", "output", "error", "outputs"]
+)
+
+
+def find_reports(input_location, svg_folder=None):
+    """Pair every PDF in a folder (or matching a glob) with its SVG
+
+    Args:
+        input_location: Folder of PDFs, or a glob pattern matching PDFs
+        svg_folder: Folder of the SVGs, named as the PDFs. Defaults to the
+            folder of each PDF.
+
+    Returns:
+        list of `Report`, sorted by name. `svg` is None if it is missing.
+    """
+    if os.path.isdir(input_location):
+        input_location = os.path.join(input_location, "*.pdf")
+
+    reports = []
+    for pdf in sorted(glob.glob(input_location)):
+        name = os.path.splitext(os.path.basename(pdf))[0]
+        svg = os.path.join(svg_folder or os.path.dirname(pdf), f"{name}.svg")
+
+        reports.append(Report(name, pdf, svg if os.path.exists(svg) else None))
+
+    return reports
+
+
+def process_report(
+    input_pdf,
+    input_svg,
+    output_folder,
+    dates_file,
+    with_summary=False,
+    dataset=None,
+    **kwargs,
+):
+    """Extract, validate and write the full CSV (and optionally the summary)
+
+    Args:
+        dataset: Optional folder of a `mobius.dataset` the results are also
+            written to
+        kwargs: Passed on to `build_report`
+
+    Returns:
+        list of the paths written
+    """
+    result_df, summary_df = build_report(input_pdf, input_svg, dates_file, **kwargs)
+
+    return write_report(
+        result_df,
+        summary_df,
+        input_pdf,
+        output_folder,
+        with_summary=with_summary,
+        dataset=dataset,
+        release=mobius.io.release_date(dates_file),
+    )
+
+
+def build_report(
+    input_pdf,
+    input_svg,
+    dates_file,
+    workers=1,
+    text_backend="layout",
+    text_cache=None,
+    subplot_cache=None,
+):
+    """Extract and validate a report, without writing anything
+
+    Returns:
+        (result_df, summary_df): full results and headline figures
+    """
+    with mobius.io.open_document(input_pdf) as doc:
+        summary_df = mobius.extraction.summarise(
+            doc,
+            dates_file,
+            workers=workers,
+            text_backend=text_backend,
+            cache=text_cache,
+        )
+
+    data = mobius.graphs.graph_process(input_svg, None, False, cache=subplot_cache)
+
+    date_lookup_df = mobius.io.read_dates_lookup(dates_file)
+
+    svg_df = mobius.csv.process_all(data, date_lookup_df)
+
+    result_df = pd.merge(
+        summary_df, svg_df, left_on="plot_num", right_on="graph_num", how="outer"
+    )
+
+    mobius.extraction.validate(result_df)
+
+    return result_df, summary_df
+
+
+def write_report(
+    result_df,
+    summary_df,
+    input_pdf,
+    output_folder,
+    with_summary=False,
+    dataset=None,
+    release=None,
+):
+    """Write the outputs of `build_report`, returning the paths written
+
+    If `dataset` is given the full results are also written to its partitions
+    for the `release` date.
+    """
+    outputs = [mobius.io.write_full_results(result_df, input_pdf, output_folder)]
+
+    if with_summary:
+        outputs.append(mobius.io.write_summary(summary_df, input_pdf, output_folder))
+
+    if dataset:
+        outputs += mobius.dataset.write_dataset(
+            result_df,
+            dataset,
+            release.strftime("%Y-%m-%d"),
+            os.path.splitext(os.path.basename(input_pdf))[0],
+        )
+
+    return outputs
+
+
+def run_batch(reports, output_folder, dates_file, workers=None, **kwargs):
+    """Run `process_report` for every report in a process pool
+
+    Args:
+        reports: `Report` items, as returned by `find_reports`
+        output_folder: Folder the CSVs are written to
+        dates_file: Dates lookup used for every report
+        workers: Number of processes, defaults to the number of CPUs. With 1
+            the reports are processed in this process.
+        kwargs: Passed on to `process_report`
+
+    Returns:
+        list of `ReportResult` in the order of `reports`
+    """
+    tasks = [(report, output_folder, dates_file, kwargs) for report in reports]
+
+    if workers == 1:
+        return [_run_report(task) for task in tqdm(tasks, desc="Processing reports")]
+
+    results = [None] * len(tasks)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_run_report, task): idx for idx, task in enumerate(tasks)
+        }
+
+        for future in tqdm(
+            as_completed(futures), total=len(futures), desc="Processing reports"
+        ):
+            idx = futures[future]
+            try:
+                results[idx] = future.result()
+            except Exception as error:
+                # The worker itself died, e.g. killed for running out of memory
+                results[idx] = ReportResult(
+                    reports[idx].name, False, "", f"{type(error).__name__}: {error}", []
+                )
+
+    return results
+
+
+def _run_report(task):
+    report, output_folder, dates_file, kwargs = task
+
+    output = io.StringIO()
+    try:
+        if report.svg is None:
+            raise FileNotFoundError(f"No SVG found for {report.pdf}")
+
+        with contextlib.redirect_stdout(output):
+            outputs = process_report(
+                report.pdf, report.svg, output_folder, dates_file, **kwargs
+            )
+
+    except Exception:
+        return ReportResult(
+            report.name, False, output.getvalue(), traceback.format_exc(), []
+        )
+
+    return ReportResult(report.name, True, output.getvalue(), None, outputs)
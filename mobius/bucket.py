@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""Locally persisted listing of the reports in the mobility-reports bucket.
+
+Listing the whole bucket is slow, so `BucketIndex` keeps the names, sizes and
+MD5 hashes of the blobs under each prefix (e.g. "SVG/") in a JSON file and
+only lists the bucket again, filtered by prefix on the server, once that
+listing is older than `ttl` seconds. Lookups by date and country use
+dictionaries built from the listing.
+
+The bucket is accessed through a source with `list(prefix)` and
+`download(name, fileobj, start=0)`: `GCSSource` for Google Cloud Storage and
+`LocalSource` for a local folder laid out like the bucket.
+
+`fetch` downloads blobs in a thread pool, skipping files whose MD5 already
+matches and resuming partial downloads left by an interrupted run.
+
+Usage:
+    index = BucketIndex(GCSSource("mobility-reports"))
+    blobs = index.lookup("PDF", date="2020-04-05", country="GB")
+    fetch(index.source, blobs)
+"""
+import base64
+import collections
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mobius.io
+
+DEFAULT_TTL = 60 * 60
+
+DEFAULT_FETCH_WORKERS = 8
+
+PARTIAL_SUFFIX = ".part"
+
+LISTING_FORMATS = ("table", "json", "csv")
+
+LISTING_COLUMNS = ["index", "country", "name", "date", "url"]
+
+BlobInfo = collections.namedtuple(
+    "BlobInfo", ["name", "size", "md5_hash", "filetype", "date", "country"]
+)
+
+_REPORT_NAME = re.compile(r"(\d{4}-\d{2}-\d{2})_(.+)_Mobility_Report_en\.\w+$")
+
+
+def load_country_names(path):
+    """{code: name} from a CSV of name and code columns, codes as "-GB" """
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["code"].lstrip("-"): row["name"] for row in csv.DictReader(f)}
+
+
+def listing_rows(blobs, country_names, url_prefix=""):
+    """Rows describing each report blob, for `format_listing`
+
+    Blobs whose names are not those of reports (no date or country) are left
+    out. The country name is looked up by the first two letters of the code,
+    so "US-Alabama" is listed under "United States".
+    """
+    reports = (blob for blob in blobs if blob.date and blob.country)
+    return [
+        {
+            "index": idx,
+            "country": blob.country,
+            "name": country_names.get(blob.country[:2], ""),
+            "date": blob.date,
+            "url": url_prefix + blob.name,
+        }
+        for idx, blob in enumerate(reports, start=1)
+    ]
+
+
+def format_listing(rows, output_format="table"):
+    """Render `listing_rows` as an aligned table, JSON or CSV"""
+    if output_format == "json":
+        return json.dumps(rows, indent=2)
+
+    if output_format == "csv":
+        output = io.StringIO()
+        writer = csv.DictWriter(
+            output, fieldnames=LISTING_COLUMNS, lineterminator="\n"
+        )
+        writer.writeheader()
+        writer.writerows(rows)
+        return output.getvalue().rstrip("\n")
+
+    return "\n".join(
+        f" {row['index']:>3}. {row['country']:<25.25} {row['name']:<40.40}  "
+        f"{row['date']}  ({row['url']})"
+        for row in rows
+    )
+
+
+def parse_blob_name(name, size=None, md5_hash=None):
+    """`BlobInfo` with the filetype, date and country code parsed from the name
+
+    e.g. "PDF/2020-04-05_GB_Mobility_Report_en.pdf" is a PDF for "GB" on
+    "2020-04-05". Date and country are None for names not in this form.
+    """
+    filetype, _, basename = name.rpartition("/")
+    match = _REPORT_NAME.match(basename)
+    date, country = match.groups() if match else (None, None)
+
+    return BlobInfo(name, size, md5_hash, filetype, date, country)
+
+
+def md5_hash(f, chunk_size=1024 ** 2):
+    """Base64 encoded MD5 digest of a binary file object, as GCS reports it"""
+    digest = hashlib.md5()
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+        digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode("ascii")
+
+
+class GCSSource:
+    """Public Google Cloud Storage bucket, accessed anonymously"""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.key = f"gs://{bucket}"
+        self._client_instance = None
+        self._lock = threading.Lock()
+
+    def _client(self):
+        """One client, and so one connection pool, shared between threads"""
+        with self._lock:
+            if self._client_instance is None:
+                from google.cloud.storage.client import Client
+
+                self._client_instance = Client.create_anonymous_client()
+
+        return self._client_instance
+
+    def list(self, prefix=""):
+        """(name, size, md5_hash) of every blob under `prefix`"""
+        for blob in self._client().list_blobs(self.bucket, prefix=prefix):
+            yield blob.name, blob.size, blob.md5_hash
+
+    def download(self, name, fileobj, start=0):
+        """Write the blob, from byte `start` on, to `fileobj`"""
+        self._client().download_blob_to_file(
+            f"{self.key}/{name}", fileobj, start=start or None
+        )
+
+
+class LocalSource:
+    """Folder standing in for a bucket, blob names being relative paths"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.key = self.root
+
+    def list(self, prefix=""):
+        """(name, size, md5_hash) of every file under `prefix`"""
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+
+                if name.startswith(prefix):
+                    with open(path, "rb") as f:
+                        yield name, os.path.getsize(path), md5_hash(f)
+
+    def download(self, name, fileobj, start=0):
+        """Write the file, from byte `start` on, to `fileobj`"""
+        with open(os.path.join(self.root, *name.split("/")), "rb") as f:
+            f.seek(start)
+            shutil.copyfileobj(f, fileobj)
+
+
+def default_manifest_path(source):
+    """Manifest file for `source` in the "bucket" cache folder"""
+    import mobius.cache
+
+    digest = hashlib.sha256(source.key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(mobius.cache.default_cache_dir("bucket"), f"{digest}.json")
+
+
+class BucketIndex:
+    """Cached, indexed listings of a bucket, one per prefix
+
+    Args:
+        source: `GCSSource` or `LocalSource`
+        path: JSON file the listings are kept in, defaults to
+            `default_manifest_path(source)`
+        ttl: Age in seconds after which a listing is refreshed, 0 to always
+            refresh
+    """
+
+    def __init__(self, source, path=None, ttl=DEFAULT_TTL):
+        self.source = source
+        self.path = path or default_manifest_path(source)
+        self.ttl = ttl
+        self._listings = self._load()
+        self._indexes = {}
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)["prefixes"]
+        except FileNotFoundError:
+            return {}
+
+    def _save(self):
+        with mobius.io.atomic_write(self.path) as f:
+            json.dump({"source": self.source.key, "prefixes": self._listings}, f)
+
+    def refresh(self, prefix):
+        """List the bucket under `prefix` and store the result"""
+        self._listings[prefix] = {
+            "fetched": time.time(),
+            "blobs": [list(blob) for blob in self.source.list(prefix)],
+        }
+        self._indexes.pop(prefix, None)
+        self._save()
+
+    def listing(self, prefix):
+        """`BlobInfo` of every blob under `prefix`, refreshed if out of date"""
+        stored = self._listings.get(prefix)
+
+        if stored is None or time.time() - stored["fetched"] >= self.ttl:
+            self.refresh(prefix)
+
+        return self._index(prefix)["all"]
+
+    def lookup(self, filetype, date=None, country=None):
+        """Blobs of a filetype ("SVG" or "PDF"), by date and/or country code"""
+        prefix = f"{filetype}/"
+        self.listing(prefix)
+        index = self._index(prefix)
+
+        if date is None and country is None:
+            return index["all"]
+        if country is None:
+            return index["date"].get(date, [])
+        if date is None:
+            return index["country"].get(country, [])
+
+        return index["date_country"].get((date, country), [])
+
+    def dates(self, filetype):
+        """Sorted dates with at least one blob of the filetype"""
+        self.listing(f"{filetype}/")
+        return sorted(date for date in self._index(f"{filetype}/")["date"] if date)
+
+    def _index(self, prefix):
+        if prefix not in self._indexes:
+            blobs = [
+                parse_blob_name(*blob) for blob in self._listings[prefix]["blobs"]
+            ]
+
+            index = {
+                "all": blobs,
+                "date": collections.defaultdict(list),
+                "country": collections.defaultdict(list),
+                "date_country": collections.defaultdict(list),
+            }
+            for blob in blobs:
+                index["date"][blob.date].append(blob)
+                index["country"][blob.country].append(blob)
+                index["date_country"][blob.date, blob.country].append(blob)
+
+            self._indexes[prefix] = index
+
+        return self._indexes[prefix]
+
+
+def report_path(blob, folder="."):
+    """Where `download` saves a report, e.g. `pdfs/GB_2020-04-05.pdf`"""
+    extension = blob.filetype.lower()
+    filename = f"{blob.country}_{blob.date}.{extension}"
+    return os.path.join(folder, f"{extension}s", filename)
+
+
+def fetch(source, blobs, path=report_path, workers=DEFAULT_FETCH_WORKERS):
+    """Download blobs concurrently, skipping those already up to date
+
+    A blob is skipped if the local file has the same MD5 as the bucket. It is
+    otherwise written to `<path>.part` and renamed into place once its MD5 is
+    verified, so an interrupted download never leaves a truncated file and is
+    resumed from the end of the `.part` file on the next run. Blobs without
+    an MD5 (e.g. composite objects) are always downloaded from the start.
+
+    Args:
+        source: `GCSSource` or `LocalSource`
+        blobs: `BlobInfo` items to download
+        path: Function of a `BlobInfo` giving the local path
+        workers: Number of threads downloading at once
+
+    Returns:
+        list of (blob, status) in the order of `blobs`, status being
+        "downloaded", "skipped" or "failed: <error>"
+    """
+
+    def fetch_one(blob):
+        try:
+            return blob, _fetch_blob(source, blob, path(blob))
+        except Exception as error:
+            return blob, f"failed: {type(error).__name__}: {error}"
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fetch_one, blobs))
+
+
+def _fetch_blob(source, blob, path):
+    if blob.md5_hash and _file_md5(path) == blob.md5_hash:
+        return "skipped"
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    partial = path + PARTIAL_SUFFIX
+
+    # Without a hash a partial download of an older blob could not be told
+    # apart, so it is only resumed when the result can be verified
+    start = os.path.getsize(partial) if os.path.exists(partial) else 0
+    if not blob.md5_hash or (blob.size is not None and start > blob.size):
+        start = 0
+
+    with open(partial, "ab" if start else "wb") as f:
+        source.download(blob.name, f, start=start)
+
+    if blob.md5_hash and _file_md5(partial) != blob.md5_hash:
+        os.remove(partial)
+        if not start:
+            raise ValueError(f"MD5 mismatch for {blob.name}")
+
+        # The partial download was stale, fetch the whole file again
+        return _fetch_blob(source, blob, path)
+
+    os.replace(partial, path)
+    return "downloaded"
+
+
+def _file_md5(path):
+    try:
+        with open(path, "rb") as f:
+            return md5_hash(f)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""Persistent on-disk cache of intermediate results, keyed by content hash.
+
+Entries are dictionaries of NumPy arrays stored as `.npz` files. The cache is
+bounded in size: reading an entry marks it as recently used and writing one
+evicts the least recently used entries once the total exceeds `max_bytes`.
+
+Usage:
+    cache = ArrayCache(default_cache_dir("text"))
+    arrays = cache.get(key)
+    if arrays is None:
+        cache.put(key, compute())
+"""
+import contextlib
+import hashlib
+import logging
+import os
+import zipfile
+
+import numpy as np
+
+import mobius.io
+
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+
+# Bump when the cached text extraction changes so stale entries are ignored
+TEXT_CACHE_VERSION = 1
+
+# Bump when the SVG subplot split changes so stale entries are ignored
+SUBPLOT_CACHE_VERSION = 2
+
+
+def default_cache_dir(kind=""):
+    """`$MOBIUS_CACHE_DIR/<kind>`, defaulting to `~/.cache/mobius/<kind>`"""
+    root = os.environ.get(
+        "MOBIUS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "mobius")
+    )
+    return os.path.join(root, kind)
+
+
+def file_digest(f, chunk_size=1024 ** 2):
+    """SHA-256 hex digest of a binary file object, or of the file at a path"""
+    if isinstance(f, (str, os.PathLike)):
+        with open(f, "rb") as fileobj:
+            return file_digest(fileobj, chunk_size)
+
+    digest = hashlib.sha256()
+    f.seek(0)
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+        digest.update(chunk)
+    f.seek(0)
+    return digest.hexdigest()
+
+
+class ArrayCache:
+    """Size-bounded LRU cache of dictionaries of arrays in a directory"""
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key, decode=None):
+        """Arrays stored under `key`, or None if not cached
+
+        If given, `decode` is applied to the arrays and its result returned.
+        An entry that cannot be read or decoded is removed and treated as a
+        miss.
+        """
+        path = self.path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+
+            if decode is not None:
+                arrays = decode(arrays)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError, KeyError, zipfile.BadZipFile) as error:
+            logging.warning(f"Removing unreadable cache entry {path}: {error}")
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            return None
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process sharing the directory
+            return None
+
+        return arrays
+
+    def put(self, key, arrays):
+        """Store the arrays under `key`, then evict down to `max_bytes`"""
+        with mobius.io.atomic_write(self.path(key), "wb") as f:
+            np.savez(f, **arrays)
+
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until within `max_bytes`"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Already evicted by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
+
+    def clear(self):
+        """Remove every entry, returning how many were removed"""
+        if not os.path.isdir(self.directory):
+            return 0
+
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith((".npz", ".tmp")):
+                os.remove(entry.path)
+                removed += 1
+        return removed
+
+
+def encode_pages(pages):
+    """Pack per-page lists of (bbox, text) into arrays"""
+    bboxes = []
+    texts = []
+    page_offsets = [0]
+    for elements in pages:
+        for bbox, text in elements:
+            bboxes.append(bbox)
+            texts.append(text.encode("utf-8"))
+        page_offsets.append(len(texts))
+
+    text_lengths = np.array([len(text) for text in texts], dtype=np.int64)
+
+    return {
+        "bboxes": np.array(bboxes, dtype=np.float64).reshape(-1, 4),
+        "page_offsets": np.array(page_offsets, dtype=np.int64),
+        "text_offsets": np.concatenate(([0], np.cumsum(text_lengths))),
+        "text": np.frombuffer(b"".join(texts), dtype=np.uint8),
+    }
+
+
+def decode_pages(arrays):
+    """Inverse of `encode_pages`, a list per page of (bbox, text)"""
+    raw = arrays["text"].tobytes()
+    text_offsets = arrays["text_offsets"].tolist()
+    texts = [
+        raw[start:end].decode("utf-8")
+        for start, end in zip(text_offsets[:-1], text_offsets[1:])
+    ]
+    bboxes = [tuple(bbox) for bbox in arrays["bboxes"].tolist()]
+
+    page_offsets = arrays["page_offsets"].tolist()
+    return [
+        list(zip(bboxes[start:end], texts[start:end]))
+        for start, end in zip(page_offsets[:-1], page_offsets[1:])
+    ]
+
+
+def encode_subplots(output):
+    """Pack {num: [(ArrayPath, attribute)]} into arrays, keeping only styles"""
+    nums = []
+    subplot_offsets = [0]
+    segment_offsets = [0]
+    kinds = []
+    points = []
+    styles = []
+    for num, path_buffer in output.items():
+        nums.append(num)
+        for path, attribute in path_buffer:
+            kinds.append(path.kinds)
+            points.append(path.points)
+            segment_offsets.append(segment_offsets[-1] + len(path))
+            styles.append(((attribute or {}).get("style") or "").encode("utf-8"))
+        subplot_offsets.append(len(styles))
+
+    style_lengths = np.array([len(style) for style in styles], dtype=np.int64)
+
+    return {
+        "nums": np.array(nums, dtype=np.int64),
+        "subplot_offsets": np.array(subplot_offsets, dtype=np.int64),
+        "segment_offsets": np.array(segment_offsets, dtype=np.int64),
+        "kinds": np.concatenate(kinds or [np.empty(0, dtype=np.int8)]),
+        "points": np.concatenate(points or [np.empty((0, 4, 2))]),
+        "style_offsets": np.concatenate(([0], np.cumsum(style_lengths))),
+        "style": np.frombuffer(b"".join(styles), dtype=np.uint8),
+    }
+
+
+def decode_subplots(arrays):
+    """Inverse of `encode_subplots`, attributes only holding the style"""
+    from mobius.paths import ArrayPath
+
+    raw = arrays["style"].tobytes()
+    style_offsets = arrays["style_offsets"].tolist()
+    segment_offsets = arrays["segment_offsets"].tolist()
+    kinds, points = arrays["kinds"], arrays["points"]
+
+    paths = [
+        (
+            ArrayPath(kinds[start:end], points[start:end]),
+            {"style": raw[style_start:style_end].decode("utf-8")},
+        )
+        for start, end, style_start, style_end in zip(
+            segment_offsets[:-1],
+            segment_offsets[1:],
+            style_offsets[:-1],
+            style_offsets[1:],
+        )
+    ]
+
+    subplot_offsets = arrays["subplot_offsets"].tolist()
+    return {
+        num: paths[start:end]
+        for num, start, end in zip(
+            arrays["nums"].tolist(), subplot_offsets[:-1], subplot_offsets[1:]
+        )
+    }
@@ -1,28 +1,82 @@
 # -*- coding: utf-8 -*-
 """Take SVG files of individual plots and convert them to CSV."""
+import itertools
 import os
 
+import numpy as np
 import pandas as pd
-import svgpathtools
-from matplotlib import pyplot as plt
 from tqdm import tqdm
 
+from mobius.paths import as_array_path, path_bboxes
+
 Y_AXIS_SPAN = 80  # Distance in percentage points from baseline to upper and lower lines
 X_AXIS_SPAN = 42  # Distance covered by x-axis in days
+BATCH_SIZE = 16  # Subplots converted together by `process_all`
 
 
 def process_all(data, date_lookup_df, output_folder=None, plots=True, save=None):
-    iterable = tqdm(data.items(), desc="Extracting data from SVG plots")
-    dfs = [
-        csv_process(paths, num, date_lookup_df, output_folder, plots, save)
-        for num, paths in iterable
-    ]
+    """Convert every subplot to a DataFrame of dated values.
+
+    Subplots are converted `BATCH_SIZE` at a time as they arrive, the trend
+    points of a batch in a single pass with `convert_units_batch`, and their
+    CSVs saved before the next batch is read. Larger batches mean fewer
+    passes but a longer wait for the first CSVs when streaming. PNG plots,
+    if asked for, are rendered once every subplot has been converted, by
+    `mobius.plots.render_plots`.
+
+    Args:
+        data: {num: paths} as returned by `graph_process`, or an iterable of
+            (num, paths) pairs such as `iter_subplots` so conversion can run
+            while the SVG is still being parsed
+    """
+    items = data.items() if hasattr(data, "items") else data
+    iterable = iter(tqdm(items, desc="Extracting data from SVG plots"))
+
+    frames = []
+    for batch in iter(lambda: list(itertools.islice(iterable, BATCH_SIZE)), []):
+        batch_df = _convert_batch(batch, date_lookup_df)
 
-    svg_df = pd.concat(dfs)
+        if save:
+            for num, result_df in batch_df.groupby("graph_num", sort=False):
+                _save_csv(result_df, num, output_folder)
+
+        frames.append(batch_df)
+
+    svg_df = pd.concat(frames) if frames else _convert_batch([], date_lookup_df)
+
+    if plots and output_folder:
+        # matplotlib is only imported when plots are drawn
+        import mobius.plots
+
+        mobius.plots.render_plots(svg_df, output_folder)
 
     return svg_df
 
 
+def _convert_batch(batch, date_lookup_df):
+    """DataFrame of dated values of a list of (num, paths) subplots"""
+    nums = []
+    xlims = []
+    y_lines = []
+    trends = []
+    for num, paths in batch:
+        xlim, lines, trend = categorise_paths(paths, num, date_lookup_df)
+        nums.append(num)
+        xlims.append(xlim)
+        y_lines.append(lines)
+        trends.append(trend)
+
+    counts = [len(trend) for trend in trends]
+    points = np.array([point for trend in trends for point in trend], dtype=complex)
+    plot_index = np.repeat(np.arange(len(trends)), counts)
+
+    days, values = convert_units_batch(
+        points, plot_index, xlims, y_lines, yspan=Y_AXIS_SPAN, xspan=X_AXIS_SPAN
+    )
+
+    return align_dates(nums, plot_index, days, values, date_lookup_df)
+
+
 def csv_process(paths, name, date_lookup, output_folder=None, plots=True, save=None):
     # Gets paths from file
     xlim, y_lines, trend = categorise_paths(paths, name, date_lookup)
@@ -36,49 +90,95 @@ def csv_process(paths, name, date_lookup, output_folder=None, plots=True, save=N
     else:
         xs = ys = []
 
-    df = pd.DataFrame(data={"value": ys, "rel_day": xs})
-
-    result_df = pd.merge(
-        date_lookup, df, left_on="index", right_on="rel_day", how="left"
+    result_df = align_dates(
+        [name],
+        np.zeros(len(xs), dtype=int),
+        np.array(xs, dtype=int),
+        np.array(ys, dtype=float),
+        date_lookup,
     )
 
-    result_df = result_df[["value", "date"]]
-    result_df["graph_num"] = name
-
     if save:
-        os.mkdir(f"{output_folder}/csv") if not os.path.exists(
-            f"{output_folder}/csv"
-        ) else False
-        result_df.to_csv(
-            os.path.join(output_folder, f"csv/{name}.csv"),
-            sep=",",
-            index=False,
-            float_format="%.3f",
-        )
+        _save_csv(result_df, name, output_folder)
 
     if plots and output_folder:
-        os.mkdir(f"{output_folder}/plot") if not os.path.exists(
-            f"{output_folder}/plot"
-        ) else False
-        plt.plot(result_df.date, result_df.value, '-o')
-        plt.ylim(-80, 80)
-        plt.xticks(rotation=90)
-        plt.xlabel("Date")
-        plt.ylabel("Mobility change %")
-        plt.axhline(y=0.5, color="k", linestyle="--", linewidth=0.5)
-        plt.tight_layout()
-        plt.savefig(os.path.join(output_folder, f"plot/{name}.png"))
-
-        plt.clf()
+        import mobius.plots
+
+        mobius.plots.render_plots(result_df, output_folder, workers=1)
 
     return result_df
 
 
+def align_dates(graph_nums, plot_index, days, values, date_lookup):
+    """Align the converted trend points of many plots against the dates lookup.
+
+    Equivalent to a left merge of `date_lookup` with the points of each plot
+    on `index == rel_day`, done for every plot in one indexed pass: each plot
+    gets one row per date, with NaN where it has no point and one row per
+    point where it has several for the same day.
+
+    Args:
+        graph_nums: number of each plot
+        plot_index: index into `graph_nums` of the plot of each point
+        days: day number of each point
+        values: value of each point
+        date_lookup: DataFrame with `index` (day number) and `date` columns
+
+    Returns:
+        DataFrame with value, date and graph_num columns, indexed by row
+        position within each plot
+    """
+    n_plots, n_days = len(graph_nums), len(date_lookup)
+
+    position = pd.Index(date_lookup["index"]).get_indexer(days)
+    matched = position >= 0
+    plot_index, position, values = plot_index[matched], position[matched], values[matched]
+
+    covered = np.zeros((n_plots, n_days), dtype=bool)
+    covered[plot_index, position] = True
+    empty_plot, empty_position = np.nonzero(~covered)
+
+    all_plot = np.concatenate([plot_index, empty_plot])
+    all_position = np.concatenate([position, empty_position])
+    all_values = np.concatenate([values, np.full(len(empty_plot), np.nan)])
+
+    # Stable, so points sharing a day keep their order along the trend
+    order = np.lexsort((all_position, all_plot))
+    all_plot, all_position = all_plot[order], all_position[order]
+
+    rows_per_plot = np.bincount(all_plot, minlength=n_plots)
+    plot_starts = np.cumsum(rows_per_plot) - rows_per_plot
+    row_index = np.arange(len(order)) - np.repeat(plot_starts, rows_per_plot)
+
+    return pd.DataFrame(
+        data={
+            "value": all_values[order],
+            "date": date_lookup["date"].to_numpy()[all_position],
+            "graph_num": np.asarray(graph_nums)[all_plot],
+        },
+        index=row_index,
+    )
+
+
+def _save_csv(result_df, name, output_folder):
+    """Save the CSV of a single graph"""
+    os.mkdir(f"{output_folder}/csv") if not os.path.exists(
+        f"{output_folder}/csv"
+    ) else False
+    result_df.to_csv(
+        os.path.join(output_folder, f"csv/{name}.csv"),
+        sep=",",
+        index=False,
+        float_format="%.3f",
+    )
+
+
 def categorise_paths(paths, name, date_lookup):
     """Categorise paths into background lines and the trend line.
 
     Args:
-        paths: Paths extracted from single plot SVG
+        paths: (path, attribute) pairs of a single plot, paths being
+            `ArrayPath` or svgpathtools paths
 
     Returns:
         (xlim, y_lines, points)
@@ -90,7 +190,7 @@ def categorise_paths(paths, name, date_lookup):
     Raises:
         ValueError: Assuming single segment trend line, not yet handled
     """
-    paths = [path[0] for path in paths]
+    paths = [as_array_path(path[0]) for path in paths]
     single_segment_lines = [path for path in paths if len(path) == 1]
 
     short_trends = []
@@ -114,19 +214,20 @@ def categorise_paths(paths, name, date_lookup):
 
         trends = [path for path in paths if len(path) > 1] + short_trends
 
-        for trend in trends:
-            if isinstance(trend[0], svgpathtools.path.CubicBezier):
-                point_xmin, point_xmax, point_ymin, point_ymax = trend.bbox()
-                xmid = (point_xmin + point_xmax) / 2
-                ymid = (point_ymin + point_ymax) / 2
+        # Centres of all the Bezier markers (isolated points) in one go
+        markers = [trend for trend in trends if trend.starts_with_cubic()]
+        bboxes = path_bboxes(markers)
+        centres = iter(
+            ((bboxes[:, 0] + bboxes[:, 1]) + 1j * (bboxes[:, 2] + bboxes[:, 3])) / 2
+        )
 
-                points.append(complex(xmid, ymid))
+        for trend in trends:
+            if trend.starts_with_cubic():
+                points.append(complex(next(centres)))
 
             else:
 
-                for sub_path in trend.continuous_subpaths():
-                    points += [segment.start for segment in sub_path]
-                    points.append(sub_path.end)
+                points.extend(trend.vertices())
 
         y_lines = sorted(y_lines, reverse=True)
 
@@ -150,19 +251,37 @@ def convert_units(trend, line_y, xlim, yspan, xspan):
         trend_plot_coords: List of (x, y) tuples
             Points on the trend line in plot coordinates
     """
-    xmin, xmax = xlim
-    x_scale = xmax - xmin
+    points = np.array(trend, dtype=complex)
+    days, values = convert_units_batch(
+        points, np.zeros(len(points), dtype=int), [xlim], [line_y], yspan, xspan
+    )
+    return list(zip(days.tolist(), values.tolist()))
+
+
+def convert_units_batch(points, plot_index, xlims, y_lines, yspan, xspan):
+    """Switch from SVG coordinates to plot coordinates for many plots at once
 
-    ymax, ymid, ymin = tuple(line_y)
-    y_scale = (abs(ymax - ymid) + abs(ymid - ymin)) / 2
+    Args:
+        points: complex array of the trend points of all plots
+        plot_index: index into `xlims`/`y_lines` of the plot of each point
+        xlims: (n_plots, 2) limits of the x axis (SVG coordinates)
+        y_lines: (n_plots, 3) y SVG coords of (-80%, baseline, 80%) lines
+        yspan: Coordinate distance from baseline to outer y_lines
+        xspan: Distance in whole days from start to end of the plot
+
+    Returns:
+        (days, values): int day numbers and float percentages of each point
+    """
+    xlims = np.asarray(xlims, dtype=float).reshape(-1, 2)
+    y_lines = np.asarray(y_lines, dtype=float).reshape(-1, 3)
+
+    xmin, xmax = xlims[plot_index].T
+    x_scale = xmax - xmin
 
-    trend_plot_coords = []
-    for point in trend:
-        x = point.real
-        y = point.imag
+    ymax, ymid, ymin = y_lines[plot_index].T
+    y_scale = (np.abs(ymax - ymid) + np.abs(ymid - ymin)) / 2
 
-        x_out = 1 + round(xspan * ((x - xmin) / x_scale))
-        y_out = yspan * ((ymid - y) / y_scale)
+    days = 1 + np.round(xspan * ((points.real - xmin) / x_scale)).astype(int)
+    values = yspan * ((ymid - points.imag) / y_scale)
 
-        trend_plot_coords.append((x_out, y_out))
-    return trend_plot_coords
+    return days, values
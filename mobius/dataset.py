@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Consolidated Parquet dataset of the full results of every report.
+
+The dataset is a folder partitioned by release date and country,
+
+    <root>/release=2020-04-05/country=United Kingdom/part-0.parquet
+
+with `region` and `plot_name` dictionary encoded, so a whole release is read
+with one columnar scan instead of parsing a CSV per report. Writing a report
+replaces its partition, so re-running a report does not duplicate its rows.
+Rows of a report without a country are written to its country's partition,
+or if it has none to a file named after the report in `NULL_PARTITION` (read
+back as a missing country), which is shared by every such report.
+
+Requires pyarrow, install with `poetry install -E parquet`.
+
+Usage:
+    write_dataset(result_df, "output/dataset", "2020-04-05", "GB_2020-04-05")
+    df = read_dataset("output/dataset", release="2020-04-05")
+"""
+import logging
+import os
+
+import mobius.io
+
+PART_FILENAME = "part-0.parquet"
+
+# Partition value read back as null by Hive style partitioning
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+COLUMNS = [
+    "country",
+    "page_num",
+    "plot_num",
+    "region",
+    "plot_name",
+    "asterisk",
+    "date",
+    "value",
+    "headline",
+]
+
+CATEGORICAL_COLUMNS = ["country", "region", "plot_name"]
+
+
+def write_dataset(result_df, root, release, report=None):
+    """Write the full results of a report into its partitions
+
+    Args:
+        result_df: Full results, as written by `mobius.io.write_full_results`
+        root: Folder of the dataset
+        release: Release date of the report, as "YYYY-MM-DD"
+        report: Name of the report, e.g. the PDF file name without extension,
+            needed to write rows without a country to `NULL_PARTITION`
+
+    Returns:
+        list of the partition files written
+
+    Raises:
+        ValueError: If there are rows for `NULL_PARTITION` but no `report`
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    df = result_df[COLUMNS].copy()
+
+    # e.g. plots in the SVG without a summary from the PDF
+    missing = df["country"].isna()
+    if missing.any():
+        countries = df.loc[~missing, "country"].unique()
+        country = countries[0] if len(countries) == 1 else NULL_PARTITION
+        logging.warning(f"Writing {missing.sum()} rows without a country to {country}")
+        df.loc[missing, "country"] = country
+
+    df = df.astype({column: "category" for column in CATEGORICAL_COLUMNS})
+
+    paths = []
+    for country, country_df in df.groupby("country", observed=True, sort=False):
+        folder = partition_folder(root, release, country)
+
+        # Reports share the null partition, so each has its own file there
+        if country == NULL_PARTITION:
+            if report is None:
+                raise ValueError("Rows without a country need a report name")
+            filename = f"{report}.parquet"
+        else:
+            filename = PART_FILENAME
+
+        table = pa.Table.from_pandas(
+            country_df.drop(columns="country"), preserve_index=False
+        )
+
+        with mobius.io.atomic_write(os.path.join(folder, filename), "wb") as f:
+            pq.write_table(table, f)
+
+        if filename == PART_FILENAME:
+            # Anything else in the partition is left from an earlier layout
+            for entry in os.scandir(folder):
+                if entry.name.endswith(".parquet") and entry.name != PART_FILENAME:
+                    os.remove(entry.path)
+
+        paths.append(os.path.join(folder, filename))
+
+    return paths
+
+
+def read_dataset(root, release=None, countries=None, columns=None):
+    """Read the dataset, or part of it, into a DataFrame
+
+    Args:
+        root: Folder of the dataset
+        release: Only read this release date
+        countries: Only read these countries
+        columns: Only read these columns
+
+    Returns:
+        DataFrame with the `release` partition column and the `COLUMNS`,
+        `release`, `country`, `region` and `plot_name` as categoricals
+    """
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    filters = []
+    if release is not None:
+        filters.append(("release", "=", release))
+    if countries is not None:
+        filters.append(("country", "in", set(countries)))
+
+    # Partition values as strings, as dictionaries cannot hold a null country
+    partitioning = ds.HivePartitioning.discover(infer_dictionary=False)
+
+    table = pq.read_table(
+        root, columns=columns, filters=filters or None, partitioning=partitioning
+    )
+    df = table.to_pandas()
+
+    categorical = [
+        column for column in ["release"] + CATEGORICAL_COLUMNS if column in df
+    ]
+    return df.astype({column: "category" for column in categorical})
+
+
+def partition_folder(root, release, country):
+    """Folder holding the rows of one country in one release"""
+    country = str(country).replace(os.sep, "-")
+    return os.path.join(root, f"release={release}", f"country={country}")
@@ -17,12 +17,18 @@ Usage:
     the headline figures.
 """
 import collections
+import io
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
-import rtree
 from tqdm import tqdm
-from datetime import datetime
+
+import mobius.cache
+import mobius.io
+from mobius.spatial import BoxIndex, make_index
 
 Anchor = collections.namedtuple("Anchor", ["left", "bottom"])
 
@@ -30,6 +36,10 @@ PlotElements = collections.namedtuple(
     "PlotElements", ["anchor", "plot_name", "headline_figure"]
 )
 
+AnchorTexts = collections.namedtuple(
+    "AnchorTexts", ["headline_figures", "plot_names", "regions"]
+)
+
 
 class PageData:
     __COUNTRY_NAME_FIXED_BOX = (20, 740, 580, 780)
@@ -47,10 +57,24 @@ class PageData:
 
     __COUNTRY_PAGES = {1, 2}
 
-    def __init__(self, page_num, text_elements, heading_date_string):
+    def __init__(
+        self, page_num, text_elements, heading_date_string, index_backend="numpy"
+    ):
+        text_elements = list(text_elements)
+
         self.heading_date_string = heading_date_string
         self.page_num = page_num
-        self.bbox_to_text, self.text_to_corner = PageData.index(text_elements)
+        self.bbox_to_text, self.text_to_corner = PageData.index(
+            text_elements, index_backend
+        )
+
+        self._texts = [text.strip() for _, text in text_elements]
+        # Positions of the text boxes sorted by bbox, as `plot_name` orders them
+        self._bbox_order = np.lexsort(
+            np.array(
+                [bbox for bbox, _ in text_elements], dtype=np.float64
+            ).reshape(-1, 4).T[::-1]
+        )
 
     def __getitem__(self, item):
         return self.text_to_corner[item]
@@ -84,14 +108,7 @@ class PageData:
 
         text = "".join(box.object for box in boxes)
 
-        clean_text = (
-            text.replace("*\n", "")
-                .replace("*", "")
-                .replace("compared to baseline", "")
-                .strip()
-        )
-
-        return clean_text
+        return PageData.__clean_headline(text)
 
     def plot_name(self, anchor):
 
@@ -105,6 +122,78 @@ class PageData:
 
         plot_names = [text.object for text in boxes]
 
+        return PageData.__clean_plot_name(plot_names)
+
+    def region(self, anchor):
+        bbox = self.__apply_offset(anchor, PageData.__REGION_OFFSETS)
+
+        text = self.text_in_box(bbox)
+        return text
+
+    def resolve_anchors(self, anchors):
+        """Headline figure, plot name and region of every anchor at once.
+
+        Equivalent to calling `headline_figure`, `plot_name` and `region` per
+        anchor, but all the query boxes are tested against all the text boxes
+        of the page in a single vectorised pass.
+
+        Returns:
+            AnchorTexts of lists aligned with `anchors`
+        """
+        if not len(anchors):
+            return AnchorTexts([], [], [])
+
+        if self.page_num in PageData.__COUNTRY_PAGES:
+            offsets = (
+                PageData.__COUNTRY_HEADLINE_OFFSETS,
+                PageData.__COUNTRY_PLOT_NAME_OFFSETS,
+            )
+        else:
+            offsets = (PageData.__HEADLINE_OFFSETS, PageData.__PLOT_NAME_OFFSETS)
+
+        corners = np.array([[a.left, a.bottom, a.left, a.bottom] for a in anchors])
+        offsets = np.array(offsets + (PageData.__REGION_OFFSETS,), dtype=np.float64)
+        bboxes = (corners[:, None, :] + offsets[None, :, :]).reshape(-1, 4)
+
+        masks = self.__intersection_masks(bboxes).reshape(len(anchors), 3, -1)
+
+        texts = self._texts
+        order = self._bbox_order
+
+        def joined(mask):
+            return "".join(texts[idx] for idx in np.flatnonzero(mask).tolist())
+
+        return AnchorTexts(
+            [PageData.__clean_headline(joined(mask)) for mask in masks[:, 0]],
+            [
+                PageData.__clean_plot_name(
+                    [texts[idx] for idx in order[mask[order]].tolist()]
+                )
+                for mask in masks[:, 1]
+            ],
+            [joined(mask) for mask in masks[:, 2]],
+        )
+
+    def __intersection_masks(self, bboxes):
+        if isinstance(self.bbox_to_text, BoxIndex):
+            return self.bbox_to_text.intersection_masks(bboxes)
+
+        masks = np.zeros((len(bboxes), len(self._texts)), dtype=bool)
+        for row, bbox in enumerate(bboxes):
+            masks[row, sorted(self.bbox_to_text.intersection(tuple(bbox)))] = True
+        return masks
+
+    @staticmethod
+    def __clean_headline(text):
+        return (
+            text.replace("*\n", "")
+                .replace("*", "")
+                .replace("compared to baseline", "")
+                .strip()
+        )
+
+    @staticmethod
+    def __clean_plot_name(plot_names):
         clean_names = [
             name for name in plot_names
             if "baseline" not in name
@@ -112,15 +201,29 @@ class PageData:
         ]
         asterisks = ["*" for name in plot_names if "baseline" in name]
 
-        plot_name = "".join(clean_names + asterisks)
+        return "".join(clean_names + asterisks)
 
-        return plot_name
-
-    def region(self, anchor):
-        bbox = self.__apply_offset(anchor, PageData.__REGION_OFFSETS)
-
-        text = self.text_in_box(bbox)
-        return text
+    @staticmethod
+    def query_boxes(anchors):
+        """Every box the extractors may query on a page with these anchors.
+
+        Covers both country and region page offsets, so the result does not
+        depend on the page number.
+        """
+        offsets = (
+            PageData.__COUNTRY_HEADLINE_OFFSETS,
+            PageData.__COUNTRY_PLOT_NAME_OFFSETS,
+            PageData.__HEADLINE_OFFSETS,
+            PageData.__PLOT_NAME_OFFSETS,
+            PageData.__REGION_OFFSETS,
+        )
+        boxes = [PageData.__COUNTRY_NAME_FIXED_BOX]
+        boxes += [
+            PageData.__apply_offset(anchor, offset)
+            for anchor in anchors
+            for offset in offsets
+        ]
+        return boxes
 
     @staticmethod
     def __apply_offset(anchor: Anchor, offset):
@@ -132,8 +235,9 @@ class PageData:
         )
 
     @staticmethod
-    def index(text_elements):
-        bbox_to_text = rtree.Rtree()
+    def index(text_elements, backend="numpy"):
+        """Index text by bounding box, using `mobius.spatial.make_index`"""
+        bbox_to_text = make_index(backend)
         text_to_corner = collections.defaultdict(list)
 
         for idx, (bbox, text) in enumerate(text_elements):
@@ -149,15 +253,14 @@ def _country_level_extractor(page_data: PageData):
 
     anchors = page_data["Baseline"]
 
-    elements = []
-
-    for anchor in anchors:
+    texts = page_data.resolve_anchors(anchors)
 
-        headline_figure = page_data.headline_figure(anchor)
-
-        plot_name = page_data.plot_name(anchor)
-
-        elements.append(PlotElements(anchor, plot_name, headline_figure))
+    elements = [
+        PlotElements(anchor, plot_name, headline_figure)
+        for anchor, plot_name, headline_figure in zip(
+            anchors, texts.plot_names, texts.headline_figures
+        )
+    ]
 
     return [("__ALL", sort_elements(elements))]
 
@@ -177,39 +280,36 @@ def _region_level_extractor(page_data: PageData):
     if len(anchors) == 0:
         return list()
 
-    top_anchors = []
-    bottom_anchors = []
+    texts = page_data.resolve_anchors(anchors)
+    regions = {}
 
-    for anchor in anchors:
+    for anchor, plot_name, headline_figure, region in zip(
+        anchors, texts.plot_names, texts.headline_figures, texts.regions
+    ):
 
         if anchor.bottom > 500:
             region_key = top_region
-            top_anchors.append(anchor)
         else:
             region_key = bottom_region
-            bottom_anchors.append(anchor)
 
-        headline_figure = page_data.headline_figure(anchor)
-
-        plot_name = page_data.plot_name(anchor)
+        regions[anchor] = region
 
         elements[region_key].append(PlotElements(anchor, plot_name, headline_figure))
 
     result = []
 
     top_plots = sort_elements(elements["top_region"])
-    _process_plots(top_plots, page_data, result)
+    _process_plots(top_plots, regions, result)
 
     bottom_plots = sort_elements(elements["bottom_region"])
-    _process_plots(bottom_plots, page_data, result)
+    _process_plots(bottom_plots, regions, result)
 
     return result
 
 
-def _process_plots(plots, page_data, result):
+def _process_plots(plots, regions, result):
     if plots:
-        region_anchor = plots[0].anchor
-        region = page_data.region(region_anchor)
+        region = regions[plots[0].anchor]
 
         result.append((region, plots))
 
@@ -224,7 +324,13 @@ def sort_elements(elements):
     return elements
 
 
-def page_gen(document):
+def page_gen(document, pagenos=None):
+    """Lay out each page, yielding its text elements as `text_gen`
+
+    Args:
+        document: PDF file object
+        pagenos: Optional set of 0-based page numbers to restrict to
+    """
     import pdfminer.converter
     import pdfminer.layout
     import pdfminer.pdfinterp
@@ -236,7 +342,7 @@ def page_gen(document):
     interpreter = pdfminer.pdfinterp.PDFPageInterpreter(rsrcmgr, device)
 
     for page_num, page in enumerate(
-        pdfminer.pdfpage.PDFPage.get_pages(document), start=1
+        pdfminer.pdfpage.PDFPage.get_pages(document, pagenos), start=1
     ):
 
         interpreter.process_page(page)
@@ -245,6 +351,255 @@ def page_gen(document):
         yield text_gen(layout)
 
 
+def roi_page_gen(document, pagenos=None, margin=10):
+    """Lay out only the text in the regions `PageData` will query
+
+    Characters are collected without layout analysis and grouped into lines
+    to find the "Baseline" anchors. Full layout analysis (grouping lines
+    into text boxes) is then only run over the anchors and the lines
+    intersecting the boxes from `PageData.query_boxes`, expanded by `margin`.
+
+    Args:
+        document: PDF file object
+        pagenos: Optional set of 0-based page numbers to restrict to
+        margin: Distance the query boxes are expanded by on every side
+    """
+    import pdfminer.converter
+    import pdfminer.layout
+    import pdfminer.pdfinterp
+    import pdfminer.pdfpage
+
+    rsrcmgr = pdfminer.pdfinterp.PDFResourceManager()
+    laparams = pdfminer.layout.LAParams(all_texts=True)
+    device = pdfminer.converter.PDFPageAggregator(rsrcmgr, laparams=None)
+    interpreter = pdfminer.pdfinterp.PDFPageInterpreter(rsrcmgr, device)
+
+    for page in pdfminer.pdfpage.PDFPage.get_pages(document, pagenos):
+
+        interpreter.process_page(page)
+        layout = device.get_result()
+
+        chars = [obj for obj in layout if isinstance(obj, pdfminer.layout.LTChar)]
+        lines = list(layout.group_objects(laparams, chars))
+
+        is_anchor = [
+            line.get_text().replace("*", "").strip() == "Baseline" for line in lines
+        ]
+        anchors = [
+            Anchor(line.x0, line.y0)
+            for line, anchor in zip(lines, is_anchor)
+            if anchor
+        ]
+
+        cropped = pdfminer.layout.LTPage(layout.pageid, layout.bbox)
+
+        if lines:
+            regions = np.array(PageData.query_boxes(anchors)) + [
+                -margin, -margin, margin, margin
+            ]
+            bboxes = np.array([line.bbox for line in lines])
+            in_region = (
+                (bboxes[:, None, 0] <= regions[None, :, 2])
+                & (bboxes[:, None, 2] >= regions[None, :, 0])
+                & (bboxes[:, None, 1] <= regions[None, :, 3])
+                & (bboxes[:, None, 3] >= regions[None, :, 1])
+            ).any(axis=1) | is_anchor
+
+            for line, keep in zip(lines, in_region.tolist()):
+                if keep:
+                    for obj in line:
+                        if isinstance(obj, pdfminer.layout.LTChar):
+                            cropped.add(obj)
+
+        cropped.analyze(laparams)
+
+        yield text_gen(cropped)
+
+
+def char_page_gen(document, pagenos=None):
+    """Extract text lines straight from the glyphs drawn on each page
+
+    Bypasses pdfminer layout analysis: a `_CharStreamDevice` records the box
+    and text of every glyph as plain tuples, merged into lines by
+    `merge_chars`. Meant for the fixed, machine-generated report layout, the
+    "layout" backend stays the reference.
+
+    Args:
+        document: PDF file object
+        pagenos: Optional set of 0-based page numbers to restrict to
+    """
+    import pdfminer.pdfinterp
+    import pdfminer.pdfpage
+
+    rsrcmgr = pdfminer.pdfinterp.PDFResourceManager()
+    device = _char_stream_device(rsrcmgr)
+    interpreter = pdfminer.pdfinterp.PDFPageInterpreter(rsrcmgr, device)
+
+    for page in pdfminer.pdfpage.PDFPage.get_pages(document, pagenos):
+
+        interpreter.process_page(page)
+
+        yield iter(merge_chars(device.chars))
+
+
+def _char_stream_device(rsrcmgr):
+    """Create a device collecting (x0, y0, x1, y1, text) per glyph"""
+    import pdfminer.pdfdevice
+    import pdfminer.pdffont
+
+    class _CharStreamDevice(pdfminer.pdfdevice.PDFTextDevice):
+        def __init__(self, rsrcmgr):
+            super().__init__(rsrcmgr)
+            self.chars = []
+            self.figure_depth = 0
+
+        def begin_page(self, page, ctm):
+            self.chars = []
+            self.figure_depth = 0
+
+        # Text inside figures is ignored, as `text_gen` only looks at the
+        # top level of the page layout
+        def begin_figure(self, name, bbox, matrix):
+            self.figure_depth += 1
+
+        def end_figure(self, name):
+            self.figure_depth -= 1
+
+        def render_char(self, matrix, font, fontsize, scaling, rise, cid, *args):
+            adv = font.char_width(cid) * fontsize * scaling
+
+            if self.figure_depth:
+                return adv
+
+            try:
+                text = font.to_unichr(cid)
+            except pdfminer.pdffont.PDFUnicodeNotDefined:
+                text = f"(cid:{cid})"
+
+            # Horizontal writing only, as in the reports
+            descent = font.get_descent() * fontsize
+            a, b, c, d, e, f = matrix
+            bottom, top = descent + rise, descent + rise + fontsize
+            x0, y0 = c * bottom + e, d * bottom + f
+            x1, y1 = a * adv + c * top + e, b * adv + d * top + f
+
+            self.chars.append(
+                (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1), text)
+            )
+            return adv
+
+    return _CharStreamDevice(rsrcmgr)
+
+
+def merge_chars(chars, gap_ratio=1.0, space_ratio=0.15):
+    """Merge glyph boxes into lines of text
+
+    Glyphs are sorted top to bottom on their rounded bottom edge, then left
+    to right. A line continues while the bottom edge is unchanged and the
+    horizontal gap to the previous glyph is at most `gap_ratio` times the
+    glyph height. Gaps over `space_ratio` times the height become spaces.
+
+    Args:
+        chars: list of (x0, y0, x1, y1, text) tuples
+
+    Returns:
+        list of (bbox, text) with text ending in a newline, as `text_gen`
+    """
+    if not chars:
+        return []
+
+    x0, y0, x1, y1, texts = zip(*chars)
+    boxes = np.array([x0, y0, x1, y1], dtype=np.float64)
+
+    order = np.lexsort((boxes[0], -np.round(boxes[1])))
+    x0, y0, x1, y1 = boxes[:, order]
+    texts = [texts[idx] for idx in order.tolist()]
+
+    height = np.maximum(y1 - y0, 1e-6)
+    gap = x0[1:] - x1[:-1]
+    limit = gap_ratio * np.maximum(height[1:], height[:-1])
+
+    new_line = (np.round(y0[1:]) != np.round(y0[:-1])) | (gap > limit) | (gap < -limit)
+    space = ~new_line & (gap > space_ratio * height[1:])
+
+    starts = np.concatenate(([0], np.flatnonzero(new_line) + 1))
+    bboxes = np.column_stack(
+        [
+            np.minimum.reduceat(x0, starts),
+            np.minimum.reduceat(y0, starts),
+            np.maximum.reduceat(x1, starts),
+            np.maximum.reduceat(y1, starts),
+        ]
+    )
+
+    separators = np.where(space, " ", "").tolist()
+    ends = np.append(starts[1:], len(texts)).tolist()
+
+    lines = []
+    for (start, end), bbox in zip(zip(starts.tolist(), ends), bboxes.tolist()):
+        text = texts[start] + "".join(
+            separator + char
+            for separator, char in zip(separators[start:end - 1], texts[start + 1:end])
+        )
+        if text.strip():
+            lines.append((tuple(bbox), text + "\n"))
+
+    return lines
+
+
+TEXT_BACKENDS = {"layout": page_gen, "roi": roi_page_gen, "chars": char_page_gen}
+
+
+def parallel_page_gen(document, workers, text_backend="layout"):
+    """Lay out pages in a process pool, yielding their text in page order
+
+    Pages are split into contiguous chunks laid out by `_layout_pages`, each
+    worker re-opening the document, so the result matches running the
+    `text_backend` page generator serially.
+
+    Args:
+        document: PDF file object, re-opened by name in the workers if it
+            has one, otherwise its content is sent to them
+        workers: Number of processes
+        text_backend: Name of the page generator in `TEXT_BACKENDS`
+    """
+    import pdfminer.pdfpage
+
+    document.seek(0)
+    n_pages = sum(1 for _ in pdfminer.pdfpage.PDFPage.get_pages(document))
+
+    name = getattr(document, "name", None)
+    if isinstance(name, str) and os.path.exists(name):
+        source = name
+    else:
+        document.seek(0)
+        source = document.read()
+
+    chunk_size = max(1, math.ceil(n_pages / (2 * workers)))
+    chunks = [
+        set(range(start, min(start + chunk_size, n_pages)))
+        for start in range(0, n_pages, chunk_size)
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            _layout_pages,
+            [source] * len(chunks),
+            chunks,
+            [text_backend] * len(chunks),
+        )
+        for pages in results:
+            yield from pages
+
+
+def _layout_pages(source, pagenos, text_backend="layout"):
+    """Text elements of the given pages as lists, run in worker processes"""
+    pages_gen = TEXT_BACKENDS[text_backend]
+
+    with (open(source, "rb") if isinstance(source, str) else io.BytesIO(source)) as f:
+        return [list(text_elements) for text_elements in pages_gen(f, pagenos)]
+
+
 def text_gen(layout):
     import pdfminer.layout
 
@@ -253,13 +608,53 @@ def text_gen(layout):
             yield element.bbox, element.get_text()
 
 
-def _extract(f, heading_date_string):
+def _page_elements(f, workers=1, text_backend="layout", cache=None):
+    """Text elements of every page, from `cache` if the PDF was seen before
+
+    Args:
+        cache: Optional `mobius.cache.ArrayCache`, keyed on the content hash
+            of the PDF and the text backend
+    """
+    if workers > 1:
+        pages = parallel_page_gen(f, workers, text_backend)
+    else:
+        pages = TEXT_BACKENDS[text_backend](f)
+
+    if cache is None:
+        return pages
+
+    key = "-".join(
+        (mobius.cache.file_digest(f), text_backend, f"v{mobius.cache.TEXT_CACHE_VERSION}")
+    )
+
+    cached = cache.get(key, mobius.cache.decode_pages)
+    if cached is not None:
+        return cached
+
+    pages = [list(text_elements) for text_elements in pages]
+    cache.put(key, mobius.cache.encode_pages(pages))
+
+    return pages
+
+
+def _extract(
+    f,
+    heading_date_string,
+    index_backend="numpy",
+    workers=1,
+    text_backend="layout",
+    cache=None,
+):
 
     country = None
 
-    for page_num, text_elements in enumerate(page_gen(f), start=1):
+    pages = _page_elements(f, workers, text_backend, cache)
+
+    for page_num, text_elements in enumerate(pages, start=1):
 
-        page_data = PageData(page_num, text_elements, heading_date_string)
+        page_data = PageData(
+            page_num, text_elements, heading_date_string, index_backend
+        )
 
         if page_num == 1:
             country = page_data.country_name()
@@ -319,15 +714,36 @@ def validate(df):
         )
 
 
-def summarise(f, dates_file):
-
-    date_string = dates_file.split('.csv')[0][-10:]
-    date_object = datetime.strptime(date_string, '%Y_%m_%d')
+def summarise(
+    f, dates_file, index_backend="numpy", workers=1, text_backend="layout", cache=None
+):
+    """Extract the headline figures of every plot of the report.
+
+    Args:
+        f: PDF file object
+        dates_file: Path of the dates lookup, named after the release date
+        index_backend: Spatial index for `PageData` ("numpy" or "rtree")
+        workers: Number of processes laying out pages, 1 to stay in process
+        text_backend: Page text generator from `TEXT_BACKENDS`, "layout"
+            (full pdfminer layout, the reference), "roi" (only the regions
+            queried by `PageData` are laid out) or "chars" (glyphs merged
+            into lines without pdfminer layout analysis)
+        cache: Optional `mobius.cache.ArrayCache` of page text, consulted
+            before running pdfminer
+    """
+
+    date_object = mobius.io.release_date(dates_file)
     heading_date_string = date_object.strftime("%B %d, %Y").replace(' 0', ' ')
 
     results = []
     for idx, data in tqdm(
-        enumerate(_extract(f, heading_date_string), start=1), desc="Extracting plot summaries"
+        enumerate(
+            _extract(
+                f, heading_date_string, index_backend, workers, text_backend, cache
+            ),
+            start=1,
+        ),
+        desc="Extracting plot summaries",
     ):
 
         country, region, page_num, plot_elements = data
@@ -1,129 +1,264 @@
 # -*- coding: utf-8 -*-
 """Extract subplots from whole pages/documents in SVG format."""
+import itertools
 import logging
+import math
 import re
-import shutil
 import os
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
 
-import svgpathtools
+import numpy as np
 
+import mobius.cache
+from mobius.paths import parse_path_data, path_bboxes, segment_bboxes
 
-def graph_process(input_file, output_folder, save=True):
+HORIZONTALS_PER_PLOT = 5
+
+# Plots on each page of a report: the country plots over the first two pages,
+# then two regions of six plots a page (the last page may be short)
+FIRST_PAGES_PLOTS = (3, 3)
+PLOTS_PER_PAGE = 12
+
+# Path data command letters ("e"/"E" excluded as they appear in exponents)
+_PATH_COMMAND = re.compile(r"[A-DF-Za-df-z]")
+
+
+def graph_process(input_file, output_folder, save=True, writers=1, cache=None):
     """Split out subplots.
 
-    If `save == True` peforms saving using `save_subplot`
+    The subplots are put in page order by `bucket_subplots` before anything
+    touches disk, so if `save == True` each one is written once under its
+    final number using `save_subplots` (with a thread pool of `writers` if
+    more than one).
+
+    If a `mobius.cache.ArrayCache` is given the split subplots are looked up
+    by the content hash of the SVG first, and stored in it otherwise. Cached
+    path attributes only hold the style.
 
     Outputs:
     {num, path_buffer}
     """
+    logging.info(f"Processing {input_file}")
 
-    # Variable that will encapsulate the results as the pipeline does its job
-    OUTPUT = {}
+    key = None
+    if cache is not None:
+        key = "-".join(
+            (
+                mobius.cache.file_digest(input_file),
+                f"v{mobius.cache.SUBPLOT_CACHE_VERSION}",
+            )
+        )
+        OUTPUT = cache.get(key, mobius.cache.decode_subplots)
 
-    def state_change(path_type_name, state):
-        return not path_type_name.startswith(state)
+        if OUTPUT is not None:
+            if save:
+                save_subplots(OUTPUT, output_folder, writers)
 
-    def expected_trend_path(name, path_buffer):
-        """Assuming after 5 horizontals we should switch to trend"""
-        return name == "horizontal" and len(path_buffer) == 5
+            return OUTPUT
 
-    def clear_buffer(num, path_buffer):
-        """Clear the current buffer.
+    relevant_elements = _extract_graph_components(_iter_svg_paths(input_file))
 
-        Note: Assumes the next path will be a horizontal
-        """
-        if save:
-            save_subplot(path_buffer, output_folder, num)
+    OUTPUT = bucket_subplots(relevant_elements)
 
-        OUTPUT[num] = path_buffer
+    if key is not None:
+        cache.put(key, mobius.cache.encode_subplots(OUTPUT))
 
-        num += 1
-        path_buffer = []
-        state = "horizontal"
-        return num, path_buffer, state
+    if save:
+        save_subplots(OUTPUT, output_folder, writers)
 
-    def convert_list_to_dict(lst):
-        """Converts a list (with lists in) to a dictionary"""
-        return dict(enumerate(lst, start=1))
+    return OUTPUT
 
-    def check_output_order(output, save, output_folder):
-        """Checks the SVGs are in the correct order, and if not, reorders them.
-        Doesn't check first six figures order currently. Assumes these are correct.
-        """
-        output_order = []
-        output_order_list = [1, 2, 3, 4, 5, 6]
 
+def bucket_subplots(relevant_elements):
+    """Assign plot paths to subplots from their position alone.
 
-        for block_start_num in range(1, 7, 6):
-            """Adds first 6 graphs in order as is"""
-            keys = list(range(block_start_num, block_start_num + 6))
-            block = [output.get(key) for key in keys]
-            for num in range(len(block)):
-                output_order.append(block[output_order_list[num]-1])
+    Horizontals are grouped into plot cells by sorting them on their column
+    then height, `HORIZONTALS_PER_PLOT` to a cell, left edges less than half
+    a plot width apart being in the same column. Every trend is then put in
+    the cell of its column whose centre is closest to the centre of its
+    bounding box, so the order of elements in a page is irrelevant.
 
-        if len(output) > 6:
+    Cells are numbered in page order. They are split into pages by the
+    document order of their first horizontal (`FIRST_PAGES_PLOTS`, then
+    `PLOTS_PER_PAGE` to a page), as pages are drawn one after the other
+    wherever they sit on the canvas. Within a page, cells are numbered top
+    to bottom in rows (a row ends once a cell starts more than half a plot
+    below the first cell of the row), then left to right.
 
-            for block_start_num in range(7, len(output), 12):
-                if len(output) - block_start_num > 6:
-                    """For pages with 12 graphs on"""
-                    keys = list(range(block_start_num, block_start_num + 12))
-                else:
-                    """For last page if it only has 6 graphs on"""
-                    keys = list(range(block_start_num, block_start_num + 6))
+    Args:
+        relevant_elements: (path_type_name, path, attribute) as given by
+            `_extract_graph_components`
 
-                block = [output.get(key) for key in keys]
+    Returns:
+        {num, path_buffer}
 
-                graph_count = 0
-                order_values = []
-                original_order = list(range(0, 12))
+    Raises:
+        ValueError: If the horizontals do not form whole plots
+    """
+    horizontals = []
+    trends = []
+    for path_type_name, path, attribute in relevant_elements:
+        if path_type_name == "horizontal":
+            horizontals.append((path, attribute))
+        else:
+            trends.append((path, attribute))
 
-                for num in range(len(block)):
-                    """Rough way of getting block graphs in order. Scale y value larger as it is the most important"""
-                    graph_count += 1
-                    order_path = block[num][2][0]
-                    order_value = round(order_path.start.imag, -2) * 1000 + order_path.start.real                   
-                    order_values.append(order_value)
+    if not horizontals:
+        return {}
 
-                new_order = [x for _, x in sorted(zip(order_values, original_order))]
-                output_order_list += [x + block_start_num for x in new_order]
+    xmin, xmax, ymin, ymax = path_bboxes([path for path, _ in horizontals]).T
+    column = _cluster(xmin, np.median(xmax - xmin) / 2)
+    height = (ymin + ymax) / 2
 
-                for num in range(len(block)):
-                    """Reorder block based on new order"""
-                    output_order.append(block[new_order[num]])
+    cells = np.lexsort((height, column))
+    if len(cells) % HORIZONTALS_PER_PLOT:
+        raise ValueError(f"{len(cells)} horizontals do not make whole plots")
 
-        if save:
-            """Renames SVG files accordingly if saved. Saves new plots to tmp folder, then deletes original svg
-            folder and renames tmp to svg.
-            """
-            os.mkdir(f"{output_folder}/tmp") if not os.path.exists(f"{output_folder}/tmp") else False
-            files = os.listdir(f"{output_folder}/svg")
-            files.sort(key=lambda f: int(re.sub('\D', '', f)))
-            num = 0
-            for file in files:
-                if file.endswith(".svg"):
-                    file.split('.')[0]
+    cells = cells.reshape(-1, HORIZONTALS_PER_PLOT)
+    cell_column = column[cells[:, 0]]
 
-                    new_file = f"{output_order_list.index(int(file.split('.')[0])) + 1}.svg"
-                    shutil.copyfile(f"{output_folder}/svg/{file}", f"{output_folder}/tmp/{new_file}")
-                    num += 1
+    if (column[cells] != cell_column[:, None]).any():
+        raise ValueError("Horizontals do not group into plots by column")
 
-            shutil.rmtree(f"{output_folder}/svg")
-            os.rename(f"{output_folder}/tmp", f"{output_folder}/svg")
+    cell_left = xmin[cells].min(axis=1)
+    cell_top = height[cells].min(axis=1)
+    cell_bottom = height[cells].max(axis=1)
+    cell_centre = (cell_top + cell_bottom) / 2
 
-        """Convert list to dictionary"""
-        output_order = convert_list_to_dict(output_order)
+    trend_cells = _locate_trends(trends, cell_column, cell_left, cell_centre)
 
-        return output_order
+    buffers = [
+        [horizontals[idx] for idx in sorted(cell)] for cell in cells.tolist()
+    ]
+    for trend, cell in zip(trends, trend_cells.tolist()):
+        if cell < 0:
+            logging.warning("Trend path outside of any plot, skipping")
+            continue
+        buffers[cell].append(trend)
 
+    page_order = _page_order(
+        cells.min(axis=1), cell_left, cell_top, cell_bottom - cell_top
+    )
 
-    logging.info(f"Processing {input_file}")
+    return {
+        num: buffers[cell] for num, cell in enumerate(page_order.tolist(), start=1)
+    }
+
+
+def _cluster(values, tolerance):
+    """Label values in ascending clusters, a gap over `tolerance` starting one"""
+    order = np.argsort(values, kind="stable")
+    labels = np.empty(len(values), dtype=int)
+    labels[order] = np.concatenate(([0], np.cumsum(np.diff(values[order]) > tolerance)))
+    return labels
+
+
+def _locate_trends(trends, cell_column, cell_left, cell_centre):
+    """Index of the cell each trend belongs to, -1 if none"""
+    trend_cells = np.full(len(trends), -1)
 
-    paths, attributes = svgpathtools.svg2paths(input_file)
+    if not trends:
+        return trend_cells
 
-    relevant_elements = _extract_graph_components(attributes, paths)
+    bboxes = path_bboxes([path for path, _ in trends])
+    trend_x = (bboxes[:, 0] + bboxes[:, 1]) / 2
+    trend_y = (bboxes[:, 2] + bboxes[:, 3]) / 2
+
+    # Column labels count up from 0 with the left edge
+    column_left = np.full(cell_column.max() + 1, np.inf)
+    np.minimum.at(column_left, cell_column, cell_left)
+    trend_column = np.searchsorted(column_left, trend_x, side="right") - 1
+
+    for column in range(len(column_left)):
+        in_column = np.flatnonzero(cell_column == column)
+        in_column = in_column[np.argsort(cell_centre[in_column], kind="stable")]
+
+        centres = cell_centre[in_column]
+        boundaries = (centres[1:] + centres[:-1]) / 2
+
+        selected = trend_column == column
+        nearest = np.searchsorted(boundaries, trend_y[selected])
+        trend_cells[selected] = in_column[nearest]
+
+    return trend_cells
+
+
+def _page_order(cell_position, cell_left, cell_top, cell_height):
+    """Order cells page by page, then in rows top to bottom, left to right"""
+    tolerance = np.median(cell_height) / 2
+
+    by_position = np.argsort(cell_position, kind="stable")
+    page_sizes = itertools.chain(FIRST_PAGES_PLOTS, itertools.repeat(PLOTS_PER_PAGE))
+
+    order = []
+    start = 0
+    for size in page_sizes:
+        if start >= len(by_position):
+            break
+
+        page = by_position[start : start + size]
+        order.append(page[_row_order(cell_left[page], cell_top[page], tolerance)])
+        start += size
+
+    return np.concatenate(order)
+
+
+def _row_order(cell_left, cell_top, tolerance):
+    """Order cells in rows top to bottom, then left to right"""
+    by_top = np.argsort(cell_top, kind="stable")
+    row = np.empty(len(by_top), dtype=int)
+
+    current_row, row_top = -1, -np.inf
+    for cell in by_top.tolist():
+        if cell_top[cell] - row_top > tolerance:
+            current_row, row_top = current_row + 1, cell_top[cell]
+        row[cell] = current_row
+
+    return np.lexsort((cell_left, row))
+
+
+def iter_subplots(input_file, output_folder=None):
+    """Lazily split subplots out of a whole report SVG.
+
+    The document is walked with `iterparse` and each subplot is yielded as
+    soon as its horizontals and trend paths have been seen, so only one
+    subplot is held in memory at a time. If `output_folder` is given each
+    subplot is saved with `save_subplot` before it is yielded.
+
+    Note: subplots are numbered in document order, and this relies on the
+    paths being in plot order. Use `graph_process` for subplots in page order
+    whatever the document order.
+
+    Yields:
+        (num, path_buffer)
+    """
+    relevant_elements = _extract_graph_components(_iter_svg_paths(input_file))
+
+    if output_folder is not None:
+        os.makedirs(os.path.join(output_folder, "svg"), exist_ok=True)
+
+    for num, path_buffer in _split_subplots(relevant_elements):
+        if output_folder is not None:
+            save_subplot(path_buffer, output_folder, num)
+
+        yield num, path_buffer
+
+
+def _split_subplots(relevant_elements):
+    """Group relevant elements into subplots.
+
+    This depends on the paths and attributes being in plot order
+    Assumes horizontals, followed by trend lines
+    """
+
+    def state_change(path_type_name, state):
+        return not path_type_name.startswith(state)
+
+    def expected_trend_path(name, path_buffer):
+        """Assuming after 5 horizontals we should switch to trend"""
+        return name == "horizontal" and len(path_buffer) == HORIZONTALS_PER_PLOT
 
-    # This depends on the paths and attributes being in plot order
-    # Assumes horizontals, followed by trend lines
     path_buffer = []
 
     state = "horizontal"
@@ -132,70 +267,163 @@ def graph_process(input_file, output_folder, save=True):
     for path_type_name, path, attribute in relevant_elements:
 
         if expected_trend_path(path_type_name, path_buffer):
-            num, path_buffer, state = clear_buffer(num, path_buffer)
+            yield num, path_buffer
+            num, path_buffer, state = num + 1, [], "horizontal"
 
         if state_change(path_type_name, state):
 
             if state == "horizontal":
                 state = "trend"
-                assert len(path_buffer) == 5
+                assert len(path_buffer) == HORIZONTALS_PER_PLOT
 
             else:
-                num, path_buffer, state = clear_buffer(num, path_buffer)
+                # Note: Assumes the next path will be a horizontal
+                yield num, path_buffer
+                num, path_buffer, state = num + 1, [], "horizontal"
 
         path_buffer.append((path, attribute))
 
-    if save:
-        os.mkdir(f"{output_folder}/svg") if not os.path.exists(
-            f"{output_folder}/svg"
-        ) else False
-        # TODO: see if this can be in clear buffer.
-        # Don't forget the last graph in the buffer
-        save_subplot(path_buffer, output_folder, num)
+    # Don't forget the last graph in the buffer
+    if path_buffer:
+        yield num, path_buffer
 
-    OUTPUT[num] = path_buffer
 
-    """Checks order"""
-    OUTPUT = check_output_order(OUTPUT, save, output_folder)
+def _iter_svg_paths(input_file):
+    """Yield the attribute dict of every <path> element in document order.
 
-    return OUTPUT
+    Elements are detached from the tree as soon as they have been read so
+    memory stays flat regardless of the size of the document.
+    """
+    parents = []
+    for event, element in ElementTree.iterparse(input_file, events=("start", "end")):
+        if event == "start":
+            parents.append(element)
+            continue
+
+        parents.pop()
+
+        if element.tag.rsplit("}", 1)[-1] == "path":
+            yield dict(element.attrib)
+
+        if parents:
+            parents[-1].remove(element)
+
+
+def save_subplots(output, output_folder, writers=1):
+    """Save every subplot to `<output_folder>/svg/<num>.svg`"""
+    os.makedirs(os.path.join(output_folder, "svg"), exist_ok=True)
+
+    if writers > 1:
+        with ThreadPoolExecutor(max_workers=writers) as executor:
+            futures = [
+                executor.submit(save_subplot, path_buffer, output_folder, num)
+                for num, path_buffer in output.items()
+            ]
+            for future in futures:
+                future.result()
+    else:
+        for num, path_buffer in output.items():
+            save_subplot(path_buffer, output_folder, num)
 
 
 def save_subplot(path_buffer, output_folder, num):
     """Take all the paths in the buffer and save them to a new file"""
     logging.info(f"Saving sublot {num}")
-    paths_to_save, attributes_to_save = tuple(zip(*path_buffer))
-    svgpathtools.wsvg(
-        paths_to_save, filename=os.path.join(output_folder, f"svg/{num}.svg"),
-    )
+    with open(os.path.join(output_folder, f"svg/{num}.svg"), "w") as f:
+        f.write(_subplot_svg(path_buffer))
 
 
-def _extract_graph_components(attributes, paths):
-    """Only keep lines of the svg related to the plots"""
-    relevant_elements = []
-    for path, attribute in zip(paths, attributes):
+def _subplot_svg(path_buffer, margin_size=0.1, mindim=600):
+    """Render the paths of a subplot as a standalone SVG document.
 
-        if path._end is None:
-            print("This does happen")
-            continue
+    The view box and size follow `svgpathtools.wsvg`: the bounding box of all
+    paths padded by `margin_size` with the shorter side `mindim` pixels.
+    """
+    mins, maxs = zip(*(segment_bboxes(path.points) for path, _ in path_buffer))
+    xmin, ymin = np.concatenate(mins).min(axis=0)
+    xmax, ymax = np.concatenate(maxs).max(axis=0)
+
+    dx = (xmax - xmin) or 1
+    dy = (ymax - ymin) or 1
+    xmin, ymin = xmin - margin_size * dx, ymin - margin_size * dy
+    dx, dy = dx * (1 + 2 * margin_size), dy * (1 + 2 * margin_size)
+
+    if dx > dy:
+        width, height = mindim, math.ceil(mindim * dy / dx)
+    else:
+        width, height = math.ceil(mindim * dx / dy), mindim
+
+    lines = [
+        '<?xml version="1.0" ?>',
+        f'<svg baseProfile="full" height="{height}px" version="1.1" '
+        f'viewBox="{xmin} {ymin} {dx} {dy}" width="{width}px" '
+        'xmlns="http://www.w3.org/2000/svg" '
+        'xmlns:ev="http://www.w3.org/2001/xml-events" '
+        'xmlns:xlink="http://www.w3.org/1999/xlink">',
+        "\t<defs/>",
+    ]
+    for path, attribute in path_buffer:
+        style = (attribute or {}).get("style", "")
+        lines.append(f'\t<path d="{path.d()}" style="{style}"/>')
+    lines.append("</svg>")
+
+    return "\n".join(lines) + "\n"
+
+
+def _extract_graph_components(elements):
+    """Only keep lines of the svg related to the plots
+
+    Elements are classified on their raw `style` (and the first command of
+    their `d` attribute) so path data is only parsed for the horizontals,
+    trends and trend points, never for glyph outlines and decorations.
+
+    Args:
+        elements: iterable of attribute dicts, one per <path>
+
+    Yields:
+        (path_type_name, path, attribute)
+    """
+    for attribute in elements:
 
-        style = attribute["style"]
+        path_type_name = _classify_element(attribute)
 
-        if style is None:
+        if path_type_name is None:
             continue
 
-        if "stroke:#dadce0" in style and "stroke-width:1.19px" in style:
-            relevant_elements.append(("horizontal", path, attribute))
-            continue
+        path = parse_path_data(attribute["d"])
 
-        # Check for a blue path, or blue filled object
-        if "stroke:#4285f4" in style:  # or ("fill:#4285f4" in style and :
-            relevant_elements.append(("trend", path, attribute))
+        if not len(path):
             continue
 
-        if "fill:#4285f4" in style and isinstance(
-            path[0], svgpathtools.path.CubicBezier
-        ):
-            relevant_elements.append(("trend_point", path, attribute))
-            continue
-    return relevant_elements
+        yield path_type_name, path, attribute
+
+
+def _classify_element(attribute):
+    """Work out the type of a <path> from its attributes without parsing it.
+
+    Returns:
+        "horizontal", "trend", "trend_point" or None if irrelevant
+    """
+    style = attribute.get("style")
+    path_data = attribute.get("d")
+
+    if style is None or not path_data:
+        return None
+
+    if "stroke:#dadce0" in style and "stroke-width:1.19px" in style:
+        return "horizontal"
+
+    # Check for a blue path, or blue filled object
+    if "stroke:#4285f4" in style:
+        return "trend"
+
+    if "fill:#4285f4" in style and _starts_with_cubic(path_data):
+        return "trend_point"
+
+    return None
+
+
+def _starts_with_cubic(path_data):
+    """Check the first segment after the initial moveto is a cubic Bezier"""
+    match = _PATH_COMMAND.search(path_data.lstrip()[1:])
+    return match is not None and match.group() in "Cc"
@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 """Handle input/output for the project"""
 import os
+import tempfile
 from contextlib import contextmanager
-
-import pandas as pd
+from datetime import datetime
 
 __DEFAULT_DATES_LOOKUP_FILEPATH = os.path.join("config", "dates_lookup_2020_04_05.csv")
 
@@ -12,10 +12,20 @@ def read_dates_lookup(filepath=None):
     if not filepath:
         filepath = __DEFAULT_DATES_LOOKUP_FILEPATH
 
+    # pandas is only imported once a lookup is read, so that `atomic_write`
+    # can be used without it
+    import pandas as pd
+
     dates_lookup = pd.read_csv(filepath)
     return dates_lookup
 
 
+def release_date(dates_file):
+    """Release date in the name of a dates lookup, e.g. `dates_lookup_2020_04_05.csv`"""
+    date_string = dates_file.split(".csv")[0][-10:]
+    return datetime.strptime(date_string, "%Y_%m_%d")
+
+
 def write_summary(df, input_pdf, output_folder):
     input_basename = os.path.basename(input_pdf)
     input_no_ext = os.path.splitext(input_basename)[0]
@@ -24,6 +34,7 @@ def write_summary(df, input_pdf, output_folder):
     outpath = os.path.join(output_folder, out_filename)
     df.to_csv(outpath, index=False, float_format="%.3f",)
     print(f"Saved summary results to {outpath}")
+    return outpath
 
 
 def write_full_results(df, input_pdf, output_folder):
@@ -47,6 +58,7 @@ def write_full_results(df, input_pdf, output_folder):
 
     df[relevant_columns].to_csv(outpath, index=False, float_format="%.3f")
     print(f"Saved full results to {outpath}")
+    return outpath
 
 
 @contextmanager
@@ -69,3 +81,26 @@ def prep_output_folder(input_file, output_folder, overwrite_name):
     except FileExistsError:
         print("Output folder exists, skip creation")
     return output_folder
+
+
+@contextmanager
+def atomic_write(path, mode="w"):
+    """Write to `path` through a hidden temporary file in the same folder,
+    moved into place once the block has run, so readers never see a partly
+    written file and an error leaves any previous file untouched.
+
+    Usage:
+        with atomic_write(path) as f:
+            json.dump(data, f)
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Record what each report was built from, to skip unchanged reports.
+
+The manifest is a JSON file in the output folder. For every report it holds
+the hashes of the PDF, SVG and dates lookup, the options and code version
+used and the paths written. A report is rebuilt when any of these differ,
+or when one of its outputs has gone missing.
+
+Usage:
+    manifest = Manifest.load(path)
+    for report, entry, reason in manifest.plan(reports, dates_file, options):
+        ...
+        manifest.record(report.name, entry, outputs)
+    manifest.save()
+"""
+import json
+import os
+
+import mobius.cache
+import mobius.io
+
+# Bump when a code change alters the CSVs written, so every report is rebuilt
+OUTPUT_VERSION = 2
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+class Manifest:
+    def __init__(self, path, reports=None):
+        self.path = path
+        self.reports = reports or {}
+
+    @classmethod
+    def load(cls, path):
+        """Read the manifest at `path`, empty if it does not exist"""
+        if not os.path.exists(path):
+            return cls(path)
+
+        with open(path) as f:
+            data = json.load(f)
+
+        return cls(path, data.get("reports", {}))
+
+    def save(self):
+        """Write the manifest, replacing the file atomically"""
+        with mobius.io.atomic_write(self.path) as f:
+            json.dump({"reports": self.reports}, f, indent=2, sort_keys=True)
+
+    @staticmethod
+    def entry(report, dates_file, options=None):
+        """What `report` would be built from now, without its outputs
+
+        Args:
+            report: `mobius.batch.Report`
+            dates_file: Path to the dates lookup
+            options: JSON serialisable settings affecting the outputs
+        """
+        return {
+            "pdf": mobius.cache.file_digest(report.pdf),
+            "svg": report.svg and mobius.cache.file_digest(report.svg),
+            "dates": mobius.cache.file_digest(dates_file),
+            "version": OUTPUT_VERSION,
+            "options": options or {},
+        }
+
+    def stale_reason(self, name, entry):
+        """Why the report needs rebuilding, or None if it is up to date"""
+        recorded = self.reports.get(name)
+
+        if recorded is None:
+            return "new"
+
+        for key, reason in (
+            ("pdf", "PDF changed"),
+            ("svg", "SVG changed"),
+            ("dates", "dates lookup changed"),
+            ("version", "code version changed"),
+            ("options", "options changed"),
+        ):
+            if recorded.get(key) != entry[key]:
+                return reason
+
+        missing = [
+            path for path in recorded.get("outputs", []) if not os.path.exists(path)
+        ]
+        if missing:
+            return f"missing {missing[0]}"
+
+        return None
+
+    def plan(self, reports, dates_file, options=None, force=False):
+        """Reports to rebuild, as (report, entry, reason) in the given order
+
+        With `force` every report is rebuilt.
+        """
+        planned = []
+        for report in reports:
+            entry = Manifest.entry(report, dates_file, options)
+            reason = "forced" if force else self.stale_reason(report.name, entry)
+
+            if reason:
+                planned.append((report, entry, reason))
+
+        return planned
+
+    def record(self, name, entry, outputs):
+        self.reports[name] = dict(entry, outputs=list(outputs))
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""Compact array-backed representation of SVG paths.
+
+Only the geometry needed downstream (segment endpoints, lengths and bounding
+boxes) is kept, as contiguous float64 arrays rather than one Python object per
+segment.
+
+Usage:
+    Main entry point is `parse_path_data`, this turns the `d` attribute of a
+    <path> into an `ArrayPath`.
+"""
+import re
+
+import numpy as np
+
+LINE = 1
+CUBIC = 3
+
+_TOKEN = re.compile(
+    r"([A-Za-z])|([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)"
+)
+
+# Number of straight pieces used to approximate the length of a cubic
+_CUBIC_LENGTH_STEPS = 16
+
+
+class ArrayPath:
+    """A path as arrays of segment types and control points.
+
+    Attributes:
+        kinds: (n,) int8 segment type codes, `LINE` or `CUBIC`
+        points: (n, 4, 2) float64 control points (x, y) of each segment.
+            Lines are stored as (start, start, end, end) and quadratics are
+            elevated to cubics, so every segment has the same shape.
+        subpath_offsets: (m + 1,) indices of the first segment of each
+            continuous subpath, followed by n
+    """
+
+    __slots__ = ("kinds", "points", "subpath_offsets")
+
+    def __init__(self, kinds, points):
+        self.kinds = np.ascontiguousarray(kinds, dtype=np.int8)
+        self.points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 4, 2)
+
+        breaks = np.flatnonzero(
+            np.any(self.points[1:, 0] != self.points[:-1, 3], axis=1)
+        )
+        self.subpath_offsets = np.concatenate(
+            ([0], breaks + 1, [len(self.kinds)])
+        ).astype(np.intp)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __repr__(self):
+        return f"ArrayPath(segments={len(self)}, subpaths={len(self.subpath_offsets) - 1})"
+
+    @property
+    def start(self):
+        x, y = self.points[0, 0]
+        return complex(x, y)
+
+    @property
+    def end(self):
+        x, y = self.points[-1, 3]
+        return complex(x, y)
+
+    def starts_with_cubic(self):
+        return len(self) > 0 and self.kinds[0] == CUBIC
+
+    def length(self):
+        """Total length, exact for lines and approximated for cubics"""
+        lines = self.kinds == LINE
+        total = np.hypot(*(self.points[lines, 3] - self.points[lines, 0]).T).sum()
+
+        if not lines.all():
+            curve = _cubic_points(self.points[~lines], _CUBIC_LENGTH_STEPS)
+            total += np.hypot(*np.diff(curve, axis=1).transpose(2, 0, 1)).sum()
+
+        return float(total)
+
+    def bbox(self):
+        """Bounding box as (xmin, xmax, ymin, ymax), as svgpathtools"""
+        mins, maxs = segment_bboxes(self.points)
+        xmin, ymin = mins.min(axis=0)
+        xmax, ymax = maxs.max(axis=0)
+        return float(xmin), float(xmax), float(ymin), float(ymax)
+
+    def vertices(self):
+        """Start of every segment plus the end of each continuous subpath.
+
+        Returns:
+            complex ndarray
+        """
+        starts = self.points[:, 0, 0] + 1j * self.points[:, 0, 1]
+        subpath_ends = self.subpath_offsets[1:]
+        ends = self.points[subpath_ends - 1, 3]
+        return np.insert(starts, subpath_ends, ends[:, 0] + 1j * ends[:, 1])
+
+    def d(self):
+        """Serialise back to SVG path data"""
+        commands = []
+        points = self.points.tolist()
+        subpath_starts = set(self.subpath_offsets[:-1].tolist())
+
+        for idx, (kind, (p0, p1, p2, p3)) in enumerate(zip(self.kinds.tolist(), points)):
+            if idx in subpath_starts:
+                commands.append(f"M {p0[0]},{p0[1]}")
+
+            if kind == LINE:
+                commands.append(f"L {p3[0]},{p3[1]}")
+            else:
+                commands.append(f"C {p1[0]},{p1[1]} {p2[0]},{p2[1]} {p3[0]},{p3[1]}")
+
+        return " ".join(commands)
+
+    @classmethod
+    def from_svgpathtools(cls, path):
+        """Convert a `svgpathtools.Path` made of lines and Beziers"""
+        kinds = []
+        points = []
+        for segment in path:
+            controls = getattr(segment, "bpoints", lambda: None)()
+
+            if controls is None:
+                raise ValueError(f"Unsupported segment type: {type(segment).__name__}")
+
+            controls = [(p.real, p.imag) for p in controls]
+
+            if len(controls) == 2:
+                kinds.append(LINE)
+                points.append([controls[0], controls[0], controls[1], controls[1]])
+            elif len(controls) == 3:
+                kinds.append(CUBIC)
+                points.append(_elevate_quadratic(*controls))
+            else:
+                kinds.append(CUBIC)
+                points.append(controls)
+
+        return cls(kinds, np.array(points, dtype=np.float64).reshape(-1, 4, 2))
+
+
+def as_array_path(path):
+    """Return `path` as an `ArrayPath`, converting svgpathtools paths"""
+    if isinstance(path, ArrayPath):
+        return path
+
+    return ArrayPath.from_svgpathtools(path)
+
+
+def parse_path_data(path_data):
+    """Parse the `d` attribute of a <path> into an `ArrayPath`.
+
+    Supports move, line (including horizontal/vertical), cubic, quadratic
+    and close commands, absolute and relative. Closing a subpath adds a
+    line back to its start, as svgpathtools does.
+
+    Raises:
+        ValueError: For elliptical arcs or malformed path data
+    """
+    tokens = _TOKEN.findall(path_data)
+
+    kinds = []
+    points = []
+
+    current = start = (0.0, 0.0)
+    last_control = None
+    command = None
+    idx = 0
+
+    def numbers(count):
+        nonlocal idx
+        values = tokens[idx:idx + count]
+        if len(values) < count or any(value[0] for value in values):
+            raise ValueError(f"Malformed path data near token {idx}: {path_data[:80]}")
+        idx += count
+        return [float(value[1]) for value in values]
+
+    def offset(x, y, relative):
+        return (current[0] + x, current[1] + y) if relative else (x, y)
+
+    def add_line(end):
+        kinds.append(LINE)
+        points.append((current, current, end, end))
+
+    while idx < len(tokens):
+        letter, _ = tokens[idx]
+
+        if letter:
+            command = letter
+            idx += 1
+            if command in "Zz":
+                if current != start:
+                    add_line(start)
+                current = start
+                last_control = None
+                continue
+        elif command is None:
+            raise ValueError(f"Path data must start with a command: {path_data[:80]}")
+
+        relative = command.islower()
+        upper = command.upper()
+
+        if upper == "M":
+            current = start = offset(*numbers(2), relative)
+            # Further coordinate pairs are implicit linetos
+            command = "l" if relative else "L"
+            last_control = None
+
+        elif upper == "L":
+            end = offset(*numbers(2), relative)
+            add_line(end)
+            current, last_control = end, None
+
+        elif upper == "H":
+            (x,) = numbers(1)
+            end = (current[0] + x if relative else x, current[1])
+            add_line(end)
+            current, last_control = end, None
+
+        elif upper == "V":
+            (y,) = numbers(1)
+            end = (current[0], current[1] + y if relative else y)
+            add_line(end)
+            current, last_control = end, None
+
+        elif upper in "CS":
+            if upper == "C":
+                x1, y1, x2, y2, x, y = numbers(6)
+                control1 = offset(x1, y1, relative)
+            else:
+                x2, y2, x, y = numbers(4)
+                control1 = _reflect(last_control, current, cubic=True)
+            control2 = offset(x2, y2, relative)
+            end = offset(x, y, relative)
+            kinds.append(CUBIC)
+            points.append((current, control1, control2, end))
+            current, last_control = end, ("C", control2)
+
+        elif upper in "QT":
+            if upper == "Q":
+                x1, y1, x, y = numbers(4)
+                control = offset(x1, y1, relative)
+            else:
+                x, y = numbers(2)
+                control = _reflect(last_control, current, cubic=False)
+            end = offset(x, y, relative)
+            kinds.append(CUBIC)
+            points.append(_elevate_quadratic(current, control, end))
+            current, last_control = end, ("Q", control)
+
+        else:
+            raise ValueError(f"Unsupported path command {command!r}")
+
+    return ArrayPath(kinds, np.array(points, dtype=np.float64).reshape(-1, 4, 2))
+
+
+def path_bboxes(paths):
+    """Bounding boxes of many paths at once.
+
+    The control points of all paths go through a single `segment_bboxes`
+    call and are reduced per path, rather than a `bbox()` call per path.
+
+    Args:
+        paths: sequence of non-empty `ArrayPath`
+
+    Returns:
+        (n, 4) array of (xmin, xmax, ymin, ymax) rows, as `ArrayPath.bbox`
+    """
+    if not len(paths):
+        return np.empty((0, 4))
+
+    counts = np.array([len(path) for path in paths])
+    mins, maxs = segment_bboxes(np.concatenate([path.points for path in paths]))
+
+    starts = np.cumsum(counts) - counts
+    mins = np.minimum.reduceat(mins, starts, axis=0)
+    maxs = np.maximum.reduceat(maxs, starts, axis=0)
+
+    return np.column_stack([mins[:, 0], maxs[:, 0], mins[:, 1], maxs[:, 1]])
+
+
+def segment_bboxes(points):
+    """Bounding boxes of many segments at once.
+
+    Cubic extrema are found in closed form from the roots of the derivative,
+    lines (stored as degenerate cubics) reduce to their endpoints.
+
+    Args:
+        points: (n, 4, 2) control points
+
+    Returns:
+        (mins, maxs): (n, 2) arrays of (x, y) minima and maxima
+    """
+    p0, p1, p2, p3 = (points[:, i] for i in range(4))
+
+    # B'(t) / 3 = a t^2 + b t + c
+    a = -p0 + 3 * p1 - 3 * p2 + p3
+    b = 2 * (p0 - 2 * p1 + p2)
+    c = p1 - p0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        discriminant = np.sqrt(np.maximum(b * b - 4 * a * c, 0))
+        quadratic = np.abs(a) > 1e-12
+        root1 = np.where(quadratic, (-b + discriminant) / (2 * a), -c / b)
+        root2 = np.where(quadratic, (-b - discriminant) / (2 * a), np.nan)
+
+    candidates = [p0, p3]
+    for t in (root1, root2):
+        valid = (t > 0) & (t < 1)
+        t = np.where(valid, t, 0.0)
+        value = _cubic_at(p0, p1, p2, p3, t)
+        candidates.append(np.where(valid, value, p0))
+
+    stacked = np.stack(candidates)
+    return stacked.min(axis=0), stacked.max(axis=0)
+
+
+def _cubic_at(p0, p1, p2, p3, t):
+    mt = 1 - t
+    return mt ** 3 * p0 + 3 * mt ** 2 * t * p1 + 3 * mt * t ** 2 * p2 + t ** 3 * p3
+
+
+def _cubic_points(points, steps):
+    """Sample (n, steps + 1, 2) points along each cubic"""
+    t = np.linspace(0, 1, steps + 1)[None, :, None]
+    p0, p1, p2, p3 = (points[:, None, i] for i in range(4))
+    return _cubic_at(p0, p1, p2, p3, t)
+
+
+def _elevate_quadratic(start, control, end):
+    """Exact cubic control points of a quadratic Bezier"""
+    control1 = (
+        start[0] + 2 / 3 * (control[0] - start[0]),
+        start[1] + 2 / 3 * (control[1] - start[1]),
+    )
+    control2 = (
+        end[0] + 2 / 3 * (control[0] - end[0]),
+        end[1] + 2 / 3 * (control[1] - end[1]),
+    )
+    return start, control1, control2, end
+
+
+def _reflect(last_control, current, cubic):
+    """Control point implied by a smooth (S/T) command"""
+    expected = "C" if cubic else "Q"
+    if last_control is None or last_control[0] != expected:
+        return current
+
+    control = last_control[1]
+    return 2 * current[0] - control[0], 2 * current[1] - control[1]
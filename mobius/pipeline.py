@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""Download, extract and write reports as overlapping stages.
+
+    download threads --(downloaded)--> extraction processes --(pending)--> writer
+
+Downloader threads fetch the PDF/SVG pair of a report and put it on the
+`downloaded` queue. The main thread takes pairs off it and submits them to a
+process pool, putting the futures on the `pending` queue, from which a writer
+thread writes the CSVs as results come in. Both queues are bounded, so a
+stage that gets ahead blocks until the next one catches up: at most about
+`queue_size` reports wait at each stage, however many are requested.
+
+Usage:
+    Main entry point is `run_pipeline`, with the blobs from
+    `mobius.bucket.BucketIndex.lookup`.
+"""
+import contextlib
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from tqdm import tqdm
+
+import mobius.batch
+import mobius.bucket
+import mobius.io
+from mobius.batch import Report, ReportResult
+
+DEFAULT_QUEUE_SIZE = 4
+
+# Marks the end of the items on a queue
+_DONE = object()
+
+
+def report_blobs(blobs):
+    """Group blobs into (name, pdf_blob, svg_blob) per country and date
+
+    Either blob is None if the bucket does not have it.
+    """
+    pairs = {}
+    for blob in blobs:
+        key = f"{blob.country}_{blob.date}"
+        pdf, svg = pairs.get(key, (None, None))
+
+        if blob.filetype == "PDF":
+            pdf = blob
+        elif blob.filetype == "SVG":
+            svg = blob
+
+        pairs[key] = (pdf, svg)
+
+    return [(name, pdf, svg) for name, (pdf, svg) in sorted(pairs.items())]
+
+
+def run_pipeline(
+    source,
+    blobs,
+    output_folder,
+    dates_file,
+    folder=".",
+    workers=None,
+    download_workers=mobius.bucket.DEFAULT_FETCH_WORKERS,
+    queue_size=DEFAULT_QUEUE_SIZE,
+    dataset=None,
+    **kwargs,
+):
+    """Download each report and process it as soon as it has arrived
+
+    Args:
+        source: `mobius.bucket.GCSSource` or `mobius.bucket.LocalSource`
+        blobs: PDF and SVG `BlobInfo` items, paired up by `report_blobs`
+        output_folder: Folder the CSVs are written to
+        dates_file: Dates lookup used for every report
+        folder: Folder holding the `pdfs` and `svgs` download folders
+        workers: Number of extraction processes, defaults to the CPU count
+        download_workers: Number of threads downloading reports
+        queue_size: Bound on the reports waiting between two stages
+        dataset: Optional folder of a `mobius.dataset` the results are also
+            written to
+        kwargs: Passed on to `mobius.batch.build_report`
+
+    Returns:
+        list of `mobius.batch.ReportResult`, in the order reports were written
+    """
+    reports = report_blobs(blobs)
+    release = mobius.io.release_date(dates_file)
+
+    downloaded = queue.Queue(maxsize=queue_size)
+    pending = queue.Queue(maxsize=queue_size)
+    stopped = threading.Event()
+    download_errors = []
+    results = []
+
+    def download(report):
+        if not stopped.is_set():
+            downloaded.put(_download_report(source, report, folder))
+
+    def download_stage():
+        try:
+            with ThreadPoolExecutor(max_workers=download_workers) as executor:
+                # Blocking on the full queue holds back further downloads
+                list(executor.map(download, reports))
+        except BaseException as error:
+            download_errors.append(error)
+        finally:
+            downloaded.put(_DONE)
+
+    def write_stage():
+        with tqdm(total=len(reports), desc="Processing reports") as progress:
+            for report, future in iter(pending.get, _DONE):
+                try:
+                    results.append(
+                        _write_result(report, future, output_folder, dataset, release)
+                    )
+                except Exception:
+                    results.append(
+                        ReportResult(report.name, False, "", traceback.format_exc(), [])
+                    )
+                progress.update()
+
+    downloader = threading.Thread(target=download_stage, daemon=True)
+    writer = threading.Thread(target=write_stage, daemon=True)
+    downloader.start()
+    writer.start()
+
+    try:
+        # Workers are started lazily, once the other threads are running: a
+        # forked worker could inherit a lock one of them holds (e.g. tqdm's)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            for report in iter(downloaded.get, _DONE):
+                if isinstance(report, ReportResult):
+                    pending.put((report, None))
+                else:
+                    task = (report, dates_file, kwargs)
+                    pending.put((report, executor.submit(_build, task)))
+    finally:
+        # If extraction stopped early, let the downloads waiting on the queue
+        # through so the downloader can finish
+        stopped.set()
+        while downloader.is_alive():
+            with contextlib.suppress(queue.Empty):
+                downloaded.get(timeout=0.1)
+        downloader.join()
+
+        pending.put(_DONE)
+        writer.join()
+
+    if download_errors:
+        raise download_errors[0]
+
+    return results
+
+
+def _download_report(source, report, folder):
+    """`Report` with the local paths, or a failed `ReportResult`"""
+    name, pdf, svg = report
+    if pdf is None or svg is None:
+        missing = "PDF" if pdf is None else "SVG"
+        return ReportResult(name, False, "", f"No {missing} in the bucket", [])
+
+    paths = []
+    for blob in (pdf, svg):
+        path = mobius.bucket.report_path(blob, folder)
+        [(_, status)] = mobius.bucket.fetch(
+            source, [blob], path=lambda _: path, workers=1
+        )
+
+        if status.startswith("failed"):
+            return ReportResult(name, False, "", f"Download {status}", [])
+
+        paths.append(path)
+
+    return Report(name, *paths)
+
+
+def _build(task):
+    report, dates_file, kwargs = task
+
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            frames = mobius.batch.build_report(
+                report.pdf, report.svg, dates_file, **kwargs
+            )
+    except Exception:
+        return None, output.getvalue(), traceback.format_exc()
+
+    return frames, output.getvalue(), None
+
+
+def _write_result(report, future, output_folder, dataset=None, release=None):
+    if future is None:
+        return report
+
+    try:
+        frames, output, error = future.result()
+    except Exception as error:
+        # The worker itself died, e.g. killed for running out of memory
+        message = f"{type(error).__name__}: {error}"
+        return ReportResult(report.name, False, "", message, [])
+
+    if error:
+        return ReportResult(report.name, False, output, error, [])
+
+    result_df, summary_df = frames
+    os.makedirs(output_folder, exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        outputs = mobius.batch.write_report(
+            result_df,
+            summary_df,
+            report.pdf,
+            output_folder,
+            with_summary=True,
+            dataset=dataset,
+            release=release,
+        )
+
+    return ReportResult(report.name, True, output, None, outputs)
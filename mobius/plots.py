@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Render diagnostic PNG plots of the data extracted from the SVG plots.
+
+Figures are drawn with the Agg backend on their own `Figure` objects rather
+than the global pyplot state, so graphs can be rendered in a process pool.
+"""
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from tqdm import tqdm
+
+
+def render_plots(svg_df, output_folder, workers=None):
+    """Save a PNG per graph to `<output_folder>/plot/<graph_num>.png`
+
+    Args:
+        svg_df: DataFrame with value, date and graph_num columns, as returned
+            by `mobius.csv.process_all`
+        output_folder: Folder to create the `plot` folder in
+        workers: Number of processes, defaults to the number of CPUs. With 1
+            the plots are rendered in this process.
+    """
+    plot_folder = os.path.join(output_folder, "plot")
+    os.makedirs(plot_folder, exist_ok=True)
+
+    tasks = [
+        (
+            df.date.to_numpy(),
+            df.value.to_numpy(),
+            os.path.join(plot_folder, f"{name}.png"),
+        )
+        for name, df in svg_df.groupby("graph_num", sort=False)
+    ]
+
+    if workers == 1:
+        for task in tqdm(tasks, desc="Rendering plots"):
+            _render_plot(task)
+        return
+
+    workers = workers or os.cpu_count()
+    chunksize = max(1, len(tasks) // (4 * workers))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_render_plot, tasks, chunksize=chunksize)
+        for _ in tqdm(results, total=len(tasks), desc="Rendering plots"):
+            pass
+
+
+def render_contact_sheet(svg_df, output_path, ncols=3):
+    """Draw every graph as an axes of a single figure saved to `output_path`"""
+    groups = list(svg_df.groupby("graph_num", sort=False))
+    nrows = max(1, math.ceil(len(groups) / ncols))
+
+    fig = Figure(figsize=(4 * ncols, 3 * nrows))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(nrows, ncols, squeeze=False, sharex=True, sharey=True)
+
+    for ax, (name, df) in zip(axes.flat, groups):
+        ax.plot(df.date.to_numpy(), df.value.to_numpy(), "-o", markersize=2)
+        ax.axhline(y=0.5, color="k", linestyle="--", linewidth=0.5)
+        ax.set_title(str(name), fontsize=8)
+
+    for ax in axes.flat[len(groups):]:
+        ax.set_visible(False)
+
+    for ax in axes[-1]:
+        ax.tick_params(axis="x", labelrotation=90, labelsize=6)
+
+    for ax in axes[:, 0]:
+        ax.set_ylabel("Mobility change %")
+
+    axes[0][0].set_ylim(-80, 80)
+    fig.tight_layout()
+    fig.savefig(output_path)
+
+
+def _render_plot(task):
+    dates, values, output_path = task
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+
+    ax.plot(dates, values, "-o")
+    ax.set_ylim(-80, 80)
+    ax.tick_params(axis="x", labelrotation=90)
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Mobility change %")
+    ax.axhline(y=0.5, color="k", linestyle="--", linewidth=0.5)
+    fig.tight_layout()
+    fig.savefig(output_path)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Spatial indexes of bounding boxes used to query text on a PDF page.
+
+`BoxIndex` keeps the boxes in NumPy arrays and answers queries with a
+vectorised overlap mask, which for the few hundred text boxes on a page is
+much cheaper to build than an `rtree.Rtree` and needs no native library.
+Both follow the `Rtree.add`/`Rtree.intersection` contract.
+"""
+import collections
+
+import numpy as np
+
+IndexedBox = collections.namedtuple("IndexedBox", ["id", "object", "bbox"])
+
+
+class BoxIndex:
+    """Array-backed bounding box index.
+
+    Boxes are (minx, miny, maxx, maxy). As with rtree, boxes touching the
+    query on an edge count as intersecting. Results come back in insertion
+    order.
+    """
+
+    def __init__(self):
+        self._ids = []
+        self._bboxes = []
+        self._objects = []
+        self._arrays = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, id, bbox, obj=None):
+        self._ids.append(id)
+        self._bboxes.append(tuple(float(value) for value in bbox))
+        self._objects.append(obj)
+        self._arrays = None
+
+    def intersection(self, bbox, objects=False):
+        """Boxes intersecting `bbox`
+
+        Args:
+            bbox: (minx, miny, maxx, maxy) query box
+            objects: If True return `IndexedBox` items (with id, object and
+                bbox), if "raw" the stored objects, otherwise the ids.
+        """
+        hits = np.flatnonzero(self.intersection_mask(bbox)).tolist()
+
+        if objects == "raw":
+            return [self._objects[idx] for idx in hits]
+
+        if objects:
+            return [
+                IndexedBox(self._ids[idx], self._objects[idx], self._bboxes[idx])
+                for idx in hits
+            ]
+
+        return [self._ids[idx] for idx in hits]
+
+    def intersection_mask(self, bbox):
+        """Boolean mask, in insertion order, of the boxes intersecting `bbox`"""
+        minx, miny, maxx, maxy = self.arrays()
+        qminx, qminy, qmaxx, qmaxy = bbox
+
+        return (minx <= qmaxx) & (maxx >= qminx) & (miny <= qmaxy) & (maxy >= qminy)
+
+    def intersection_masks(self, bboxes):
+        """(m, n) boolean mask of the boxes intersecting each of m query boxes"""
+        minx, miny, maxx, maxy = self.arrays()
+        qminx, qminy, qmaxx, qmaxy = (
+            np.asarray(bboxes, dtype=np.float64).reshape(-1, 4).T[:, :, None]
+        )
+
+        return (minx <= qmaxx) & (maxx >= qminx) & (miny <= qmaxy) & (maxy >= qminy)
+
+    def arrays(self):
+        """The (minx, miny, maxx, maxy) coordinate arrays of all boxes"""
+        if self._arrays is None:
+            self._arrays = np.array(self._bboxes, dtype=np.float64).reshape(-1, 4).T
+
+        return self._arrays
+
+
+def make_index(backend="numpy"):
+    """Create an empty index for the given backend ("numpy" or "rtree")"""
+    if backend == "numpy":
+        return BoxIndex()
+
+    if backend == "rtree":
+        import rtree
+
+        return rtree.Rtree()
+
+    raise ValueError(f"Unknown spatial index backend: {backend}")
@@ -10,10 +10,12 @@ run_all.sh [COMMAND] DATE [STATES]
 
 Commands
 
-    full    - run both the extraction and summary
+    full    - run just the extraction
     summary - run just the summary
     help    - prints this help text
 
+With no command both are written, parsing each PDF only once.
+
 Date format: yyyy-mm-dd (Note: passing a date is mandatory at the moment)
 
 STATES - by passing \`true\` as the value for STATES, it will run on
@@ -58,13 +60,15 @@ DATES_FILE="config/dates_lookup_${CLEAN}.csv"
 echo "Using $DATES_FILE as lookup"
 
 # List all the countries/states
+# Second column of the CSV listing is the country code
+CODES=$(./mobius.py svg $DATE --format csv | tail -n +2 | cut -d, -f2)
+
 case $STATES in 
     true)
-    COUNTRIES=$(./mobius.py svg | sed -En "s/.*[0-9 \.]+([US-]{2}(\-[A-Z][A-Za-z_]+)).*$DATE.*/\1/p")
-
+    COUNTRIES=$(echo "$CODES" | grep "^US-" || true)
     ;;
     *)
-    COUNTRIES=$(./mobius.py svg | sed -En "s/.*[0-9 \.]+([A-Z]{2}(\-[A-Z][A-Za-z_]+)?).*$DATE.*/\1/p")
+    COUNTRIES=$(echo "$CODES" | grep -v "^US-" || true)
     ;;
 esac
 
@@ -78,19 +82,26 @@ summary () {
     ./mobius.py summary pdfs/"${1}_${DATE}".pdf output $DATES_FILE
 }
 
+full_and_summary () {
+    ./mobius.py full --with-summary pdfs/"${1}_${DATE}".pdf svgs/"${1}_${DATE}".svg output $DATES_FILE
+}
+
+
+# Download the pdf and svg of each country to run, skipping files already up
+# to date
+if [ ${#COUNTRIES[@]} -gt 0 ]; then
+    ./mobius.py download-all $DATE $(printf -- "-c %s " "${COUNTRIES[@]}") \
+        || echo "Some downloads failed"
+fi
 
 for COUNTRY in "${COUNTRIES[@]}"
 do
         echo Running for $COUNTRY $DATE
 
-        # Download pdf and svg
-        ./mobius.py download $COUNTRY $DATE
-
         case $MODE in
           ALL)
             echo "Running summary and full"
-            full $COUNTRY 
-            summary $COUNTRY 
+            full_and_summary $COUNTRY
             ;;
 
           SUMMARY)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+
+import mobius
+
+DATES_FILE = "../config/dates_lookup_2020_04_05.csv"
+
+
+def test_run_batch_isolates_failures(tmp_path):
+    # Given
+    reports_folder = tmp_path / "reports"
+    output_folder = tmp_path / "output"
+    reports_folder.mkdir()
+    output_folder.mkdir()
+
+    shutil.copy("resources/report.pdf", reports_folder / "good.pdf")
+    shutil.copy("resources/report.svg", reports_folder / "good.svg")
+    (reports_folder / "broken.pdf").write_bytes(b"not a pdf")
+    shutil.copy("resources/report.svg", reports_folder / "broken.svg")
+    shutil.copy("resources/report.pdf", reports_folder / "no_svg.pdf")
+
+    reports = mobius.batch.find_reports(str(reports_folder))
+
+    # When
+    results = mobius.batch.run_batch(
+        reports, str(output_folder), DATES_FILE, workers=2, with_summary=True
+    )
+
+    # Then
+    assert [result.name for result in results] == ["broken", "good", "no_svg"]
+    assert [result.ok for result in results] == [False, True, False]
+    assert "No SVG found" in results[2].error
+    assert "Plots with data" in results[1].output
+    assert sorted(os.listdir(output_folder)) == ["good.csv", "good_summary.csv"]
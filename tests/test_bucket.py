@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+import json
+
+from mobius.bucket import (
+    BucketIndex,
+    LocalSource,
+    fetch,
+    format_listing,
+    listing_rows,
+    load_country_names,
+    parse_blob_name,
+    report_path,
+)
+
+
+def _write_reports(root, filetype, dates, countries):
+    folder = root / filetype
+    folder.mkdir(exist_ok=True)
+    for date in dates:
+        for country in countries:
+            name = f"{date}_{country}_Mobility_Report_en.{filetype.lower()}"
+            (folder / name).write_text(f"{country} {date}")
+
+
+def test_bucket_index_lookup(tmp_path):
+    # Given
+    bucket = tmp_path / "bucket"
+    bucket.mkdir()
+    _write_reports(bucket, "PDF", ["2020-03-29", "2020-04-05"], ["GB", "US-Alabama"])
+    _write_reports(bucket, "SVG", ["2020-04-05"], ["GB"])
+
+    index = BucketIndex(LocalSource(str(bucket)), path=str(tmp_path / "index.json"))
+
+    # When
+    blobs = index.lookup("PDF", date="2020-04-05", country="US-Alabama")
+
+    # Then
+    assert [blob.name for blob in blobs] == [
+        "PDF/2020-04-05_US-Alabama_Mobility_Report_en.pdf"
+    ]
+    assert blobs[0].size == len("US-Alabama 2020-04-05")
+    assert len(index.lookup("PDF", country="GB")) == 2
+    assert index.dates("PDF") == ["2020-03-29", "2020-04-05"]
+    assert index.dates("SVG") == ["2020-04-05"]
+
+
+def test_bucket_index_refreshes_after_ttl(tmp_path):
+    # Given
+    bucket = tmp_path / "bucket"
+    bucket.mkdir()
+    _write_reports(bucket, "PDF", ["2020-03-29"], ["GB"])
+    path = str(tmp_path / "index.json")
+
+    BucketIndex(LocalSource(str(bucket)), path=path).lookup("PDF")
+    _write_reports(bucket, "PDF", ["2020-04-05"], ["GB"])
+
+    # When
+    cached = BucketIndex(LocalSource(str(bucket)), path=path).dates("PDF")
+    refreshed = BucketIndex(LocalSource(str(bucket)), path=path, ttl=0).dates("PDF")
+
+    # Then
+    assert cached == ["2020-03-29"]
+    assert refreshed == ["2020-03-29", "2020-04-05"]
+
+
+def test_fetch_skips_and_resumes(tmp_path):
+    # Given
+    bucket = tmp_path / "bucket"
+    bucket.mkdir()
+    _write_reports(bucket, "PDF", ["2020-04-05"], ["GB", "FR", "DE"])
+    index = BucketIndex(LocalSource(str(bucket)), path=str(tmp_path / "index.json"))
+    blobs = index.lookup("PDF")
+
+    output = tmp_path / "output"
+    (output / "pdfs").mkdir(parents=True)
+    (output / "pdfs" / "GB_2020-04-05.pdf").write_text("GB 2020-04-05")
+    (output / "pdfs" / "FR_2020-04-05.pdf.part").write_text("FR ")
+    (output / "pdfs" / "DE_2020-04-05.pdf").write_text("outdated")
+
+    # When
+    results = fetch(
+        index.source, blobs, path=lambda blob: report_path(blob, str(output)), workers=2
+    )
+
+    # Then
+    statuses = {blob.country: status for blob, status in results}
+    assert statuses == {"GB": "skipped", "FR": "downloaded", "DE": "downloaded"}
+    for country in ("GB", "FR", "DE"):
+        path = output / "pdfs" / f"{country}_2020-04-05.pdf"
+        assert path.read_text() == f"{country} 2020-04-05"
+    assert sorted(p.name for p in (output / "pdfs").iterdir()) == [
+        "DE_2020-04-05.pdf",
+        "FR_2020-04-05.pdf",
+        "GB_2020-04-05.pdf",
+    ]
+
+
+def test_fetch_restarts_blobs_without_md5(tmp_path):
+    # Given
+    bucket = tmp_path / "bucket"
+    bucket.mkdir()
+    _write_reports(bucket, "PDF", ["2020-04-05"], ["GB"])
+    index = BucketIndex(LocalSource(str(bucket)), path=str(tmp_path / "index.json"))
+    blobs = [blob._replace(md5_hash=None) for blob in index.lookup("PDF")]
+
+    path = tmp_path / "GB_2020-04-05.pdf"
+    (tmp_path / "GB_2020-04-05.pdf.part").write_text("stale")
+
+    # When
+    [(_, status)] = fetch(index.source, blobs, path=lambda blob: str(path))
+
+    # Then
+    assert status == "downloaded"
+    assert path.read_text() == "GB 2020-04-05"
+
+def test_format_listing():
+    # Given
+    blobs = [
+        parse_blob_name("PDF/2020-04-05_GB_Mobility_Report_en.pdf"),
+        parse_blob_name("PDF/2020-04-05_US-Alabama_Mobility_Report_en.pdf"),
+        parse_blob_name("PDF/README.txt"),
+    ]
+    country_names = load_country_names("../config/country_codes.csv")
+
+    # When
+    rows = listing_rows(blobs, country_names, "https://example.com/")
+    table = format_listing(rows)
+    parsed = list(csv.DictReader(io.StringIO(format_listing(rows, "csv"))))
+
+    # Then
+    assert [row["name"] for row in rows] == ["United Kingdom", "United States"]
+    assert len(table.splitlines()) == 2
+    assert table.splitlines()[1].startswith("   2. US-Alabama ")
+    assert json.loads(format_listing(rows, "json")) == rows
+    assert parsed[0]["country"] == "GB"
+    assert parsed[1]["url"] == "https://example.com/" + blobs[1].name
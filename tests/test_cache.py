@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+
+import mobius
+from mobius.cache import ArrayCache, decode_pages, encode_pages
+
+
+def test_encode_decode_pages():
+    # Given
+    pages = [
+        [((1.0, 2.0, 3.0, 4.0), "Baseline\n"), ((5.0, 6.0, 7.0, 8.0), "Île-de-France\n")],
+        [],
+        [((0.5, 0.5, 1.5, 1.5), "-12%\n")],
+    ]
+
+    # When
+    decoded = decode_pages(encode_pages(pages))
+
+    # Then
+    assert decoded == pages
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    # Given
+    cache = ArrayCache(str(tmp_path), max_bytes=5000)
+    arrays = {"values": np.zeros(256)}
+
+    # When
+    cache.put("first", arrays)
+    cache.put("second", arrays)
+    os.utime(cache.path("first"), (0, 0))
+    os.utime(cache.path("second"), (1, 1))
+    cache.get("first")
+    cache.put("third", arrays)
+
+    # Then
+    assert cache.get("second") is None
+    assert cache.get("first") is not None
+    assert cache.get("third") is not None
+    assert cache.clear() == 2
+
+
+def test_cache_tolerates_entries_removed_by_another_process(tmp_path, monkeypatch):
+    # Given
+    cache = ArrayCache(str(tmp_path), max_bytes=5000)
+    arrays = {"values": np.zeros(256)}
+    cache.put("first", arrays)
+    cache.put("second", arrays)
+    os.utime(cache.path("first"), (0, 0))
+
+    def removed_first(function):
+        def wrapper(path, *args):
+            if os.path.exists(path):
+                os.unlink(path)
+            return function(path, *args)
+
+        return wrapper
+
+    # When
+    monkeypatch.setattr(os, "remove", removed_first(os.remove))
+    cache.put("third", arrays)
+    monkeypatch.setattr(os, "utime", removed_first(os.utime))
+    arrays = cache.get("third")
+
+    # Then
+    assert arrays is None
+    assert sorted(os.listdir(tmp_path)) == ["second.npz"]
+
+
+def test_summarise_with_cache(tmp_path):
+    # Given
+    filepath = "resources/report.pdf"
+    dates_file = "../config/dates_lookup_2020_04_05.csv"
+    cache = ArrayCache(str(tmp_path))
+
+    # When
+    with mobius.io.open_document(filepath) as doc:
+        first_df = mobius.extraction.summarise(doc, dates_file, cache=cache)
+
+    with mobius.io.open_document(filepath) as doc:
+        cached_df = mobius.extraction.summarise(doc, dates_file, cache=cache)
+
+    # Then
+    assert len(os.listdir(tmp_path)) == 1
+    assert cached_df.equals(first_df)
+
+
+def test_graph_process_with_cache(tmp_path):
+    # Given
+    filepath = "resources/report.svg"
+    dates_file = "../config/dates_lookup_2020_04_05.csv"
+    date_lookup_df = mobius.io.read_dates_lookup(dates_file)
+    cache = ArrayCache(str(tmp_path))
+
+    # When
+    first = mobius.graphs.graph_process(filepath, None, False, cache=cache)
+    cached = mobius.graphs.graph_process(filepath, None, False, cache=cache)
+
+    # Then
+    assert len(os.listdir(tmp_path)) == 1
+    assert list(cached) == list(first)
+    for num in first:
+        assert [path.d() for path, _ in cached[num]] == [
+            path.d() for path, _ in first[num]
+        ]
+        assert [attribute["style"] for _, attribute in cached[num]] == [
+            attribute["style"] for _, attribute in first[num]
+        ]
+
+    assert (
+        mobius.csv.process_all(cached, date_lookup_df, plots=False)
+        .equals(mobius.csv.process_all(first, date_lookup_df, plots=False))
+    )
+
+
+def test_cache_removes_unreadable_entries(tmp_path):
+    # Given
+    cache = ArrayCache(str(tmp_path))
+    cache.put("truncated", {"values": np.zeros(256)})
+    with open(cache.path("truncated"), "r+b") as f:
+        f.truncate(100)
+    cache.put("other", {"values": np.zeros(256)})
+
+    # When
+    truncated = cache.get("truncated")
+    other = cache.get("other", decode_pages)
+
+    # Then
+    assert truncated is None
+    assert other is None
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+
+from click.testing import CliRunner
+
+from mobius.bucket import BucketIndex, LocalSource
+
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mobius.py")
+
+DATES_FILE = "../config/dates_lookup_2020_04_05.csv"
+
+
+def _load_cli():
+    spec = importlib.util.spec_from_file_location("mobius_cli", CLI)
+    cli = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(cli)
+    return cli.cli
+
+
+def test_full_with_summary(tmp_path):
+    # Given
+    cli = _load_cli()
+    runner = CliRunner()
+    inputs = ["resources/report.pdf", "resources/report.svg"]
+    (tmp_path / "full").mkdir()
+    (tmp_path / "summary").mkdir()
+
+    # When
+    full = runner.invoke(
+        cli,
+        [
+            "full",
+            *inputs,
+            str(tmp_path / "full"),
+            DATES_FILE,
+            "--no-cache",
+            "--with-summary",
+        ],
+    )
+    summary = runner.invoke(
+        cli, ["summary", inputs[0], str(tmp_path / "summary"), DATES_FILE, "--no-cache"]
+    )
+
+    # Then
+    assert full.exit_code == 0, full.output
+    assert summary.exit_code == 0, summary.output
+    assert sorted(os.listdir(tmp_path / "full")) == ["report.csv", "report_summary.csv"]
+    assert (tmp_path / "full" / "report_summary.csv").read_text() == (
+        tmp_path / "summary" / "report_summary.csv"
+    ).read_text()
+
+
+def test_pipeline_does_not_hang(tmp_path):
+    # Given
+    bucket = tmp_path / "bucket"
+    for filetype in ("PDF", "SVG"):
+        extension = filetype.lower()
+        (bucket / filetype).mkdir(parents=True)
+        for country in ("AA", "BB"):
+            name = f"2020-04-05_{country}_Mobility_Report_en.{extension}"
+            shutil.copy(f"resources/report.{extension}", bucket / filetype / name)
+
+    command = [sys.executable, CLI, "--bucket-dir", str(bucket), "pipeline"]
+    command += ["2020-04-05", "output", os.path.abspath(DATES_FILE)]
+    command += ["-j", "2", "--no-cache"]
+    env = dict(os.environ, MOBIUS_CACHE_DIR=str(tmp_path / "cache"))
+
+    # When
+    # The hang was intermittent, so run a few times
+    completed = [
+        subprocess.run(command, cwd=tmp_path, env=env, capture_output=True, timeout=120)
+        for _ in range(3)
+    ]
+
+    # Then
+    assert [process.returncode for process in completed] == [0, 0, 0]
+    assert sorted(os.listdir(tmp_path / "output")) == [
+        "AA_2020-04-05.csv",
+        "AA_2020-04-05_summary.csv",
+        "BB_2020-04-05.csv",
+        "BB_2020-04-05_summary.csv",
+    ]
+
+
+def test_download_fails_for_missing_blob(tmp_path, monkeypatch):
+    # Given
+    monkeypatch.setenv("MOBIUS_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.chdir(tmp_path)
+    cli = _load_cli()
+    bucket = tmp_path / "bucket"
+    for filetype in ("PDF", "SVG"):
+        (bucket / filetype).mkdir(parents=True)
+        name = f"2020-04-05_GB_Mobility_Report_en.{filetype.lower()}"
+        (bucket / filetype / name).write_text("GB")
+
+    # Deleted after the bucket was listed
+    index = BucketIndex(LocalSource(str(bucket)))
+    index.lookup("PDF")
+    index.lookup("SVG")
+    (bucket / "PDF" / "2020-04-05_GB_Mobility_Report_en.pdf").unlink()
+
+    # When
+    result = CliRunner().invoke(
+        cli, ["--bucket-dir", str(bucket), "download", "GB", "2020-04-05"]
+    )
+
+    # Then
+    assert result.exit_code == 1
+    assert "GB 2020-04-05 pdf failed" in result.output
+    assert (tmp_path / "svgs" / "GB_2020-04-05.svg").exists()
+
+
+def test_dt_lists_dates(tmp_path, monkeypatch):
+    # Given
+    monkeypatch.setenv("MOBIUS_CACHE_DIR", str(tmp_path / "cache"))
+    cli = _load_cli()
+    bucket = tmp_path / "bucket"
+    (bucket / "PDF").mkdir(parents=True)
+    for name in ("2020-04-05_GB", "2020-03-29_GB", "2020-04-05_FR"):
+        (bucket / "PDF" / f"{name}_Mobility_Report_en.pdf").write_text(name)
+    (bucket / "PDF" / "README.txt").write_text("")
+
+    # When
+    result = CliRunner().invoke(cli, ["--bucket-dir", str(bucket), "dt"])
+
+    # Then
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines() == ["2020-03-29", "2020-04-05"]
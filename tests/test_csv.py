@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*-
+import os
+
+import numpy as np
 from svgpathtools.path import Path, Line
 
 import mobius
@@ -21,3 +24,59 @@ def test_single_segment_lines():
 
     # Then
     assert round(df.at[42, "value"]) == -64
+
+
+def test_convert_units_batch():
+    # Given
+    points = np.array([10 + 10j, 20 + 0j, 100 + 50j])
+    plot_index = np.array([0, 0, 1])
+    xlims = [(10, 52), (100, 184)]
+    y_lines = [(20, 10, 0), (60, 50, 40)]
+
+    # When
+    days, values = mobius.csv.convert_units_batch(
+        points, plot_index, xlims, y_lines, yspan=80, xspan=42
+    )
+
+    # Then
+    assert list(days) == [1, 11, 1]
+    assert list(values) == [0, 80, 0]
+
+
+def test_align_dates():
+    # Given
+    date_lookup = mobius.io.read_dates_lookup(filepath="../config/dates_lookup_2020_04_05.csv")
+    plot_index = np.array([0, 1, 1])
+    days = np.array([1, 43, 43])
+    values = np.array([1.0, 2.0, 3.0])
+
+    # When
+    df = mobius.csv.align_dates([7, 8], plot_index, days, values, date_lookup)
+
+    # Then
+    assert len(df) == 2 * len(date_lookup) + 1
+    assert df.loc[df.graph_num == 7, "value"].count() == 1
+    assert list(df.loc[df.graph_num == 8, "value"].dropna()) == [2.0, 3.0]
+
+
+def test_process_all_saves_csvs_as_subplots_arrive(tmp_path, monkeypatch):
+    # Given
+    monkeypatch.setattr(mobius.csv, "BATCH_SIZE", 2)
+    date_lookup = mobius.io.read_dates_lookup(filepath="../config/dates_lookup_2020_04_05.csv")
+    saved_before = {}
+
+    def subplots():
+        for num, path_buffer in mobius.graphs.iter_subplots("resources/report.svg"):
+            if num == 3:
+                saved_before[num] = sorted(os.listdir(tmp_path / "csv"))
+            yield num, path_buffer
+
+    # When
+    df = mobius.csv.process_all(
+        subplots(), date_lookup, output_folder=str(tmp_path), plots=False, save=True
+    )
+
+    # Then
+    assert saved_before[3] == ["1.csv", "2.csv"]
+    assert sorted(os.listdir(tmp_path / "csv")) == ["1.csv", "2.csv", "3.csv", "4.csv"]
+    assert list(df.graph_num.unique()) == [1, 2, 3, 4]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+import mobius
+
+pytest.importorskip("pyarrow")
+
+
+def _result_df(country, values):
+    return pd.DataFrame(
+        {
+            "country": country,
+            "page_num": 1,
+            "plot_num": 1.0,
+            "region": country,
+            "plot_name": "Parks",
+            "asterisk": False,
+            "date": pd.date_range("2020-03-01", periods=len(values)),
+            "value": values,
+            "headline": "-10%",
+        }
+    )
+
+
+def test_write_and_read_dataset(tmp_path):
+    # Given
+    root = str(tmp_path / "dataset")
+    mobius.dataset.write_dataset(_result_df("Testland", [1.0, 2.0]), root, "2020-04-05")
+    mobius.dataset.write_dataset(_result_df("Otherland", [3.0]), root, "2020-04-05")
+    mobius.dataset.write_dataset(_result_df("Testland", [4.0]), root, "2020-04-12")
+
+    # When
+    # Re-running a report replaces its rows
+    mobius.dataset.write_dataset(
+        _result_df("Testland", [5.0, 6.0]), root, "2020-04-05"
+    )
+    df = mobius.dataset.read_dataset(root, release="2020-04-05")
+    testland = mobius.dataset.read_dataset(root, countries=["Testland"])
+
+    # Then
+    assert sorted(df.value) == [3.0, 5.0, 6.0]
+    assert set(df.country) == {"Testland", "Otherland"}
+    assert df.region.dtype == "category"
+    assert df.plot_name.dtype == "category"
+    assert sorted(testland.value) == [4.0, 5.0, 6.0]
+
+
+def test_write_dataset_keeps_rows_without_a_country(tmp_path):
+    # Given
+    root = str(tmp_path / "dataset")
+    report = _result_df("Testland", [1.0, 1.0, 2.0])
+    report.loc[2, "country"] = None
+    unknown = _result_df(None, [3.0])
+    other_unknown = _result_df(None, [4.0])
+
+    # When
+    mobius.dataset.write_dataset(report, root, "2020-04-05")
+    mobius.dataset.write_dataset(unknown, root, "2020-04-05", "AA_2020-04-05")
+    mobius.dataset.write_dataset(other_unknown, root, "2020-04-05", "BB_2020-04-05")
+    df = mobius.dataset.read_dataset(root)
+
+    # Then
+    assert sorted(df.value[df.country == "Testland"]) == [1.0, 1.0, 2.0]
+    assert sorted(df.value[df.country.isna()]) == [3.0, 4.0]
+    with pytest.raises(ValueError):
+        mobius.dataset.write_dataset(unknown, root, "2020-04-05")
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import mobius
+from mobius.spatial import BoxIndex
+
+DATES_FILE = "../config/dates_lookup_2020_04_05.csv"
+
+
+def test_summarise():
+    # Given
+    filepath = "resources/report.pdf"
+
+    # When
+    with mobius.io.open_document(filepath) as doc:
+        df = mobius.extraction.summarise(doc, DATES_FILE)
+
+    # Then
+    assert list(df.plot_num) == list(range(1, 13))
+    assert set(df.country) == {"Testland"}
+    assert list(df.region.unique()) == ["Testland", "North Region", "South Region"]
+    assert list(df.headline[:3]) == ["-85%", "-46%", "-52%"]
+    assert df.plot_name[8] == "Parks"
+
+
+def test_box_index_intersection():
+    # Given
+    index = BoxIndex()
+    index.add(0, (0, 0, 1, 1), "a")
+    index.add(1, (2, 2, 3, 3), "b")
+    index.add(2, (5, 5, 6, 6), "c")
+
+    # When
+    items = index.intersection((1, 1, 2, 2), objects=True)
+
+    # Then
+    assert [item.object for item in items] == ["a", "b"]
+    assert items[1].bbox == (2, 2, 3, 3)
+    assert index.intersection((4, 4, 7, 7)) == [2]
+
+
+def test_resolve_anchors_matches_per_anchor_queries():
+    # Given
+    filepath = "resources/report.pdf"
+
+    with mobius.io.open_document(filepath) as doc:
+        pages = list(mobius.extraction._page_elements(doc))
+
+    for page_num, text_elements in enumerate(pages, start=1):
+        page_data = mobius.extraction.PageData(
+            page_num, text_elements, "April 5, 2020"
+        )
+        anchors = page_data["Baseline"]
+
+        # When
+        texts = page_data.resolve_anchors(anchors)
+
+        # Then
+        assert texts.headline_figures == [
+            page_data.headline_figure(anchor) for anchor in anchors
+        ]
+        assert texts.plot_names == [page_data.plot_name(anchor) for anchor in anchors]
+        assert texts.regions == [page_data.region(anchor) for anchor in anchors]
+
+
+def test_summarise_parallel_matches_serial():
+    # Given
+    filepath = "resources/report.pdf"
+
+    # When
+    with mobius.io.open_document(filepath) as doc:
+        serial_df = mobius.extraction.summarise(doc, DATES_FILE)
+
+    with mobius.io.open_document(filepath) as doc:
+        parallel_df = mobius.extraction.summarise(doc, DATES_FILE, workers=2)
+
+    # Then
+    assert parallel_df.equals(serial_df)
+
+
+def test_summarise_roi_matches_layout():
+    # Given
+    filepath = "resources/report.pdf"
+
+    # When
+    with mobius.io.open_document(filepath) as doc:
+        layout_df = mobius.extraction.summarise(doc, DATES_FILE)
+
+    with mobius.io.open_document(filepath) as doc:
+        roi_df = mobius.extraction.summarise(doc, DATES_FILE, text_backend="roi")
+
+    # Then
+    assert roi_df.equals(layout_df)
+
+
+def test_summarise_chars_matches_layout():
+    # Given
+    filepath = "resources/report.pdf"
+
+    # When
+    with mobius.io.open_document(filepath) as doc:
+        layout_df = mobius.extraction.summarise(doc, DATES_FILE)
+
+    with mobius.io.open_document(filepath) as doc:
+        chars_df = mobius.extraction.summarise(doc, DATES_FILE, text_backend="chars")
+
+    # Then
+    assert chars_df.equals(layout_df)
+
+
+def test_merge_chars():
+    # Given
+    chars = [
+        (20, 100, 25, 110, "b"),
+        (10, 100, 15, 110, "a"),
+        (200, 100, 205, 110, "c"),
+        (10, 50, 15, 60, "d"),
+    ]
+
+    # When
+    lines = mobius.extraction.merge_chars(chars)
+
+    # Then
+    assert lines == [
+        ((10, 100, 25, 110), "a b\n"),
+        ((200, 100, 205, 110), "c\n"),
+        ((10, 50, 15, 60), "d\n"),
+    ]
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import os
+
+import mobius
+from mobius.paths import parse_path_data
+
+HORIZONTAL_STYLE = {"style": "fill:none;stroke:#dadce0;stroke-width:1.19px;"}
+TREND_STYLE = {"style": "fill:none;stroke:#4285f4;stroke-width:4.76px;"}
+
+
+def test_iter_subplots():
+    # Given
+    filepath = "resources/report.svg"
+
+    # When
+    subplots = list(mobius.graphs.iter_subplots(filepath))
+
+    # Then
+    assert [num for num, _ in subplots] == [1, 2, 3, 4]
+    assert [len(path_buffer) for _, path_buffer in subplots] == [9, 6, 7, 8]
+
+
+def test_iter_subplots_saves_as_it_goes(tmp_path):
+    # Given
+    filepath = "resources/report.svg"
+
+    # When
+    subplots = mobius.graphs.iter_subplots(filepath, str(tmp_path))
+    next(subplots)
+    saved_first = sorted(os.listdir(tmp_path / "svg"))
+    list(subplots)
+
+    # Then
+    assert saved_first == ["1.svg"]
+    assert sorted(os.listdir(tmp_path / "svg")) == ["1.svg", "2.svg", "3.svg", "4.svg"]
+
+def test_classify_element():
+    # Given
+    glyph = {"d": "M 1,1 C 2,2 3,3 4,4", "style": "fill:#202124;fill-rule:nonzero;"}
+    marker = {"d": "M 1,1 C 2,2 3,3 4,4", "style": "fill:#4285f4;fill-rule:nonzero;"}
+    filled_line = {"d": "M 1e1,1 L 2,2", "style": "fill:#4285f4;fill-rule:nonzero;"}
+
+    # When
+    types = [
+        mobius.graphs._classify_element(attribute)
+        for attribute in (glyph, marker, filled_line)
+    ]
+
+    # Then
+    assert types == [None, "trend_point", None]
+
+
+def test_graph_process_saves_in_final_order(tmp_path):
+    # Given
+    filepath = "resources/report.svg"
+
+    # When
+    output = mobius.graphs.graph_process(filepath, str(tmp_path), save=True, writers=2)
+
+    # Then
+    assert sorted(output) == [1, 2, 3, 4]
+    assert sorted(os.listdir(tmp_path / "svg")) == ["1.svg", "2.svg", "3.svg", "4.svg"]
+
+
+def test_bucket_subplots_ignores_document_order():
+    # Given
+    filepath = "resources/report.svg"
+    elements = list(
+        mobius.graphs._extract_graph_components(mobius.graphs._iter_svg_paths(filepath))
+    )
+
+    # The first three plots are on the first page
+    first_page = [
+        idx for idx, (name, _, _) in enumerate(elements) if name == "horizontal"
+    ][3 * mobius.graphs.HORIZONTALS_PER_PLOT]
+
+    # When
+    in_order = mobius.graphs.bucket_subplots(elements)
+    reversed_order = mobius.graphs.bucket_subplots(
+        elements[:first_page][::-1] + elements[first_page:]
+    )
+
+    # Then
+    assert [len(in_order[num]) for num in in_order] == [9, 6, 7, 8]
+    for num in in_order:
+        assert {id(path) for path, _ in in_order[num]} == {
+            id(path) for path, _ in reversed_order[num]
+        }
+
+
+def _plot_elements(x, y):
+    """Horizontals and a trend of a 200 by 100 plot with its top left at x, y"""
+    horizontals = [
+        parse_path_data(f"M {x},{y + dy} L {x + 200},{y + dy}")
+        for dy in (100, 75, 50, 25, 0)
+    ]
+    trend = parse_path_data(f"M {x},{y + 50} L {x + 100},{y + 40} L {x + 200},{y + 60}")
+
+    return [("horizontal", path, HORIZONTAL_STYLE) for path in horizontals] + [
+        ("trend", trend, TREND_STYLE)
+    ]
+
+
+def _previous_order(plots):
+    """Plot positions as numbered by the block re-sorting `graph_process` did
+    before `bucket_subplots`: the first six in document order, then each
+    block of twelve by rounded height then left edge of its first trend point
+    """
+    order = plots[:6]
+    for start in range(6, len(plots), 12):
+        block = plots[start : start + 12]
+        order += sorted(block, key=lambda xy: round(xy[1] + 50, -2) * 1000 + xy[0])
+    return order
+
+
+def test_bucket_subplots_orders_pages_side_by_side():
+    # Given
+    # Pages 1000 wide sit side by side: three plots stacked on each of the
+    # first two pages, then a page of twelve and a page of six in rows of
+    # three, each page drawn in its own order
+    pages = [
+        [(100, 100), (100, 400), (100, 700)],
+        [(1100, 100), (1100, 400), (1100, 700)],
+        [(2000 + x, y) for y in (100, 300, 600, 800) for x in (100, 400, 700)][::-1],
+        [(3000 + x, y) for y in (100, 300) for x in (100, 400, 700)][::-1],
+    ]
+    plots = [xy for page in pages for xy in page]
+    elements = [element for x, y in plots for element in _plot_elements(x, y)]
+
+    # When
+    output = mobius.graphs.bucket_subplots(elements)
+
+    # Then
+    positions = [
+        (path_buffer[0][0].start.real, path_buffer[-1][0].start.imag - 50)
+        for path_buffer in output.values()
+    ]
+    assert list(output) == list(range(1, 25))
+    assert positions == _previous_order(plots)
+
+
+def test_bucket_subplots_clusters_columns():
+    # Given
+    # Two plots of one column whose left edges round differently
+    top = _plot_elements(10112.4, 100)
+    bottom = _plot_elements(10112.6, 300)
+
+    # When
+    output = mobius.graphs.bucket_subplots(top + bottom)
+
+    # Then
+    assert [len(path_buffer) for path_buffer in output.values()] == [6, 6]
+    assert {id(path) for path, _ in output[1]} == {id(path) for _, path, _ in top}
+    assert {id(path) for path, _ in output[2]} == {id(path) for _, path, _ in bottom}
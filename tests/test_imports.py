@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import os
+import importlib.util
+import subprocess
+import sys
+
+import mobius
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CLI = os.path.join(ROOT, "mobius.py")
+
+HEAVY_MODULES = {
+    "google.cloud.storage",
+    "matplotlib",
+    "numpy",
+    "pandas",
+    "pdfminer",
+    "rtree",
+    "svgpathtools",
+    "tqdm",
+}
+
+
+def _imported_modules(*args):
+    """Modules imported, with cumulative microseconds, per `python -X importtime`"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def test_import_package_is_light():
+    # When
+    modules = _imported_modules("-c", "import mobius")
+
+    # Then
+    assert not HEAVY_MODULES & set(modules)
+
+
+def test_cli_help_is_light():
+    # When
+    modules = _imported_modules(CLI, "--help")
+
+    # Then
+    assert not HEAVY_MODULES & set(modules)
+    # Generous bound on the package itself, loaded with the CLI
+    assert modules["mobius"] < 200_000
+
+
+def test_cli_text_backends_match_extraction():
+    # Given
+    spec = importlib.util.spec_from_file_location("mobius_cli", CLI)
+    cli = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(cli)
+
+    # Then
+    assert cli.TEXT_BACKENDS == list(mobius.extraction.TEXT_BACKENDS)
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+import mobius
+
+
+def test_atomic_write_keeps_previous_file_on_error(tmp_path):
+    # Given
+    path = tmp_path / "folder" / "data.json"
+    with mobius.io.atomic_write(str(path)) as f:
+        f.write("first")
+
+    # When
+    with pytest.raises(RuntimeError):
+        with mobius.io.atomic_write(str(path)) as f:
+            f.write("partial")
+            raise RuntimeError("Interrupted")
+
+    # Then
+    assert path.read_text() == "first"
+    assert os.listdir(tmp_path / "folder") == ["data.json"]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from mobius.batch import Report
+from mobius.manifest import Manifest
+
+
+def test_plan_skips_unchanged_reports(tmp_path):
+    # Given
+    for name in ("a.pdf", "a.svg", "b.pdf", "b.svg", "dates.csv", "a.csv"):
+        (tmp_path / name).write_text(name)
+
+    reports = [
+        Report(name, str(tmp_path / f"{name}.pdf"), str(tmp_path / f"{name}.svg"))
+        for name in ("a", "b")
+    ]
+    dates_file = str(tmp_path / "dates.csv")
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+
+    for report, entry, _ in manifest.plan(reports, dates_file):
+        manifest.record(report.name, entry, [str(tmp_path / "a.csv")])
+    manifest.save()
+
+    # When
+    manifest = Manifest.load(str(tmp_path / "manifest.json"))
+    unchanged = manifest.plan(reports, dates_file)
+    forced = manifest.plan(reports, dates_file, force=True)
+    other_options = manifest.plan(reports, dates_file, {"text_backend": "roi"})
+
+    (tmp_path / "b.svg").write_text("changed")
+    (tmp_path / "a.csv").unlink()
+    changed = manifest.plan(reports, dates_file)
+
+    # Then
+    assert unchanged == []
+    assert [reason for _, _, reason in forced] == ["forced", "forced"]
+    assert [reason for _, _, reason in other_options] == ["options changed"] * 2
+    assert [reason for _, _, reason in changed] == [
+        f"missing {tmp_path / 'a.csv'}",
+        "SVG changed",
+    ]
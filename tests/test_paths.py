@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from svgpathtools import parse_path
+
+from mobius.paths import CUBIC, LINE, ArrayPath, parse_path_data, path_bboxes
+
+
+def test_parse_path_data():
+    # Given
+    path_data = "M 10,10 L 20,10 M 30,10 l 5,5 h 5 C 41,16 42,17 43,18"
+
+    # When
+    path = parse_path_data(path_data)
+
+    # Then
+    assert list(path.kinds) == [LINE, LINE, LINE, CUBIC]
+    assert list(path.subpath_offsets) == [0, 1, 4]
+    assert path.start == 10 + 10j
+    assert path.end == 43 + 18j
+    assert list(path.vertices()) == [10 + 10j, 20 + 10j, 30 + 10j, 35 + 15j, 40 + 15j, 43 + 18j]
+
+
+def test_bbox_matches_svgpathtools():
+    # Given
+    path_data = "M 10355.8,2029.76 C 10355.8,2031.075 10355.335,2032.198 10354.405,2033.128 " \
+                "C 10353.475,2034.058 10352.352,2034.523 10351.037,2034.523"
+
+    # When
+    bbox = parse_path_data(path_data).bbox()
+
+    # Then
+    expected = parse_path(path_data).bbox()
+    assert all(abs(a - b) < 1e-9 for a, b in zip(bbox, expected))
+
+
+def test_from_svgpathtools_roundtrip():
+    # Given
+    path = parse_path("M 0,0 L 1,1 Q 2,2 3,1 Z")
+
+    # When
+    array_path = ArrayPath.from_svgpathtools(path)
+
+    # Then
+    assert len(array_path) == len(path)
+    assert (parse_path_data(array_path.d()).points == array_path.points).all()
+
+
+def test_path_bboxes():
+    # Given
+    paths = [
+        parse_path_data("M 0,0 C 0,1 1,1 1,0"),
+        parse_path_data("M 5,5 L 6,7 L 4,6"),
+    ]
+
+    # When
+    bboxes = path_bboxes(paths)
+
+    # Then
+    assert bboxes.shape == (2, 4)
+    for bbox, path in zip(bboxes, paths):
+        assert tuple(bbox) == path.bbox()
+    assert tuple(bboxes[0]) == (0, 1, 0, 0.75)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import shutil
+
+import pytest
+
+import mobius
+from mobius.batch import ReportResult
+from mobius.bucket import BucketIndex, LocalSource, parse_blob_name
+
+DATES_FILE = "../config/dates_lookup_2020_04_05.csv"
+
+
+def test_run_pipeline(tmp_path):
+    # Given
+    for filetype, countries in (("PDF", ["AA", "BB", "CC"]), ("SVG", ["AA", "BB"])):
+        folder = tmp_path / "bucket" / filetype
+        folder.mkdir(parents=True)
+        for country in countries:
+            shutil.copy(
+                f"resources/report.{filetype.lower()}",
+                folder / f"2020-04-05_{country}_Mobility_Report_en.{filetype.lower()}",
+            )
+
+    index = BucketIndex(
+        LocalSource(str(tmp_path / "bucket")), path=str(tmp_path / "index.json")
+    )
+    blobs = index.lookup("PDF") + index.lookup("SVG")
+
+    # When
+    results = mobius.pipeline.run_pipeline(
+        index.source,
+        blobs,
+        str(tmp_path / "output"),
+        DATES_FILE,
+        folder=str(tmp_path),
+        workers=2,
+        download_workers=2,
+        queue_size=1,
+    )
+
+    # Then
+    results = sorted(results)
+    assert [(result.name, result.ok) for result in results] == [
+        ("AA_2020-04-05", True),
+        ("BB_2020-04-05", True),
+        ("CC_2020-04-05", False),
+    ]
+    assert results[2].error == "No SVG in the bucket"
+    assert (tmp_path / "pdfs" / "AA_2020-04-05.pdf").exists()
+    assert (tmp_path / "output" / "BB_2020-04-05_summary.csv").exists()
+    assert (tmp_path / "output" / "AA_2020-04-05.csv").read_text() == (
+        tmp_path / "output" / "BB_2020-04-05.csv"
+    ).read_text()
+
+
+def test_run_pipeline_raises_download_errors(tmp_path, monkeypatch):
+    # Given
+    blobs = [
+        parse_blob_name(f"{filetype}/2020-04-05_{country}_Mobility_Report_en.pdf")
+        for filetype in ("PDF", "SVG")
+        for country in ("AA", "BB", "CC")
+    ]
+
+    def download_report(source, report, folder):
+        if report[0].startswith("BB"):
+            raise RuntimeError("Connection reset")
+        return ReportResult(report[0], False, "", "Not downloaded", [])
+
+    monkeypatch.setattr(mobius.pipeline, "_download_report", download_report)
+
+    # When / Then
+    with pytest.raises(RuntimeError, match="Connection reset"):
+        mobius.pipeline.run_pipeline(
+            LocalSource(str(tmp_path)),
+            blobs,
+            str(tmp_path / "output"),
+            DATES_FILE,
+            folder=str(tmp_path),
+            workers=1,
+            download_workers=1,
+            queue_size=1,
+        )